@@ -1,101 +1,530 @@
+"""Adapter do serviço de embeddings / vector store.
+
+A API principal é assíncrona (`aget_embedding`, `aupsert_vector`, `asearch_vector`) e
+usa um `httpx.AsyncClient` compartilhado (pool de conexões keep-alive) por event loop,
+para não bloquear o loop do uvicorn a cada ida e volta. As funções síncronas
+(`get_embedding`, `upsert_vector`, `search_vector`) são wrappers finos para scripts;
+não devem ser chamadas de dentro de um event loop.
+
+O caminho que funciona para cada operação (embed/upsert/search) é descoberto uma vez,
+testando os candidatos, e gravado num arquivo de contrato local
+(`EMBEDDING_CONTRACT_PATH`). Em regime, cada chamada faz exatamente uma requisição; a
+sondagem só é refeita quando o caminho conhecido responde 404/405/501.
+`probe_embedding_contract.py --write` grava esse arquivo antecipadamente.
+
+`aembed(text)` é a porta de entrada para chamadores que pedem um texto por vez: os
+pedidos concorrentes (do mesmo modelo) são agrupados até `EMBEDDING_BATCH_SIZE` textos,
+`EMBEDDING_BATCH_TOKENS` tokens estimados ou `EMBEDDING_BATCH_WAIT_MS` de espera, e
+enviados numa única requisição; cada chamador recebe o seu vetor. O serviço limita
+requisições por segundo, não vetores, então o agrupamento multiplica a vazão.
+`batch_stats()` expõe a distribuição de tamanhos de lote.
+
+Com `EMBEDDING_CACHE_PATH` definido, `aget_embedding`/`aembed` consultam antes um cache
+endereçado por conteúdo (`embedding_cache.py`, requer `numpy`): só os textos ausentes
+vão ao serviço, e os vetores recebidos são gravados no cache. A consulta roda no event
+loop sem esperar pelos locks do cache: se outro worker estiver gravando, conta como miss.
+
+`aupsert_vectors(items)` é a carga em massa: aceita um iterável ou iterador assíncrono,
+envia lotes de até `EMBEDDING_UPSERT_BATCH` itens / `EMBEDDING_UPSERT_MAX_BYTES` bytes
+de JSON, com até `EMBEDDING_UPSERT_CONCURRENCY` requisições em paralelo e
+`EMBEDDING_UPSERT_RETRIES` novas tentativas por lote (erros de rede, 429 e 5xx), e
+devolve o status de cada item.
+
+Com `VECTOR_BACKEND=local`, upsert e busca vão para o índice em processo
+(`adapters/vector_index.py`) em vez do serviço; só os embeddings continuam remotos. O índice
+é gravado em `aclose()` (shutdown) ou por `save_index()`, nunca a cada chamada síncrona.
+"""
+import asyncio
+import json
+import logging
 import os
-import requests
-from typing import List, Dict, Any, Optional
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Union
+
+import httpx
+
+from ..batching import MicroBatcher
+from ..prompting import estimate_tokens
 
 EMBEDDING_URL = os.getenv('EMBEDDING_URL', 'http://localhost:8001')
 # Allow overriding paths if the embedding service uses non-standard routes
 EMBEDDING_EMBED_PATH = os.getenv('EMBEDDING_EMBED_PATH', '/v1/embeddings')
 EMBEDDING_UPSERT_PATH = os.getenv('EMBEDDING_UPSERT_PATH', '/v1/upsert')
 EMBEDDING_SEARCH_PATH = os.getenv('EMBEDDING_SEARCH_PATH', '/v1/search')
+EMBEDDING_TIMEOUT = float(os.getenv('EMBEDDING_TIMEOUT', '10'))
+EMBEDDING_MAX_CONNECTIONS = int(os.getenv('EMBEDDING_MAX_CONNECTIONS', '50'))
+EMBEDDING_CONTRACT_PATH = os.getenv('EMBEDDING_CONTRACT_PATH', 'embedding_contract.json')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_BATCH_TOKENS = int(os.getenv('EMBEDDING_BATCH_TOKENS', '8000'))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', '5'))
+EMBEDDING_UPSERT_BATCH = int(os.getenv('EMBEDDING_UPSERT_BATCH', '256'))
+EMBEDDING_UPSERT_MAX_BYTES = int(os.getenv('EMBEDDING_UPSERT_MAX_BYTES', str(4 << 20)))
+EMBEDDING_UPSERT_CONCURRENCY = int(os.getenv('EMBEDDING_UPSERT_CONCURRENCY', '4'))
+EMBEDDING_UPSERT_RETRIES = int(os.getenv('EMBEDDING_UPSERT_RETRIES', '3'))
+EMBEDDING_UPSERT_BACKOFF = float(os.getenv('EMBEDDING_UPSERT_BACKOFF', '0.5'))
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'remote').lower()
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH')
+EMBEDDING_CACHE_MAX_MB = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '256'))
+EMBEDDING_CACHE_READONLY = os.getenv('EMBEDDING_CACHE_READONLY', '0').lower() in ('1', 'true', 'yes')
+
+EMBED_CANDIDATES = [EMBEDDING_EMBED_PATH, '/v1/embeddings', '/embeddings', '/v1/embed', '/embed']
+UPSERT_CANDIDATES = [EMBEDDING_UPSERT_PATH, '/v1/upsert', '/upsert', '/v1/collections/upsert']
+SEARCH_CANDIDATES = [EMBEDDING_SEARCH_PATH, '/v1/search', '/search', '/v1/query', '/query']
+
+# respostas que indicam caminho errado (e não serviço com problema): refazem a sondagem
+PATH_ERRORS = (404, 405, 501)
+
+logger = logging.getLogger(__name__)
+
+# operação -> caminho resolvido; None até o arquivo de contrato ser lido
+_resolved: Optional[Dict[str, str]] = None
+
+# cache de vetores (compartilhado entre loops e threads); criado na primeira chamada
+_cache: Any = None
+_cache_lock = threading.Lock()
+
+# um cliente por event loop: o cliente fica preso ao loop em que foi criado
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = weakref.WeakKeyDictionary()
+
+# idem para os agrupadores (as futures também são do loop): loop -> modelo -> MicroBatcher
+_batchers: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, MicroBatcher]]' = weakref.WeakKeyDictionary()
 
 
 def _url(path: str) -> str:
     return EMBEDDING_URL.rstrip('/') + '/' + path.lstrip('/')
 
 
-def get_embedding(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
-    """Pede embeddings para o serviço de embeddings.
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=EMBEDDING_MAX_CONNECTIONS,
+        max_keepalive_connections=EMBEDDING_MAX_CONNECTIONS,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=EMBEDDING_TIMEOUT)
 
-    Assunção de contrato (ajustar conforme implementação do serviço):
-    POST {EMBEDDING_URL}/v1/embeddings
-    body: { "inputs": [..], "model": "..." }
-    response: { "embeddings": [[...], ...] }
-    """
-    # try a few common paths if the configured one fails
-    candidates = [EMBEDDING_EMBED_PATH, '/v1/embeddings', '/embeddings', '/v1/embed', '/embed']
-    payload = {'inputs': texts}
-    if model:
-        payload['model'] = model
-    body = None
-    last_err = None
-    for p in candidates:
+
+def _get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = _build_client()
+    return client
+
+
+async def _close_loop() -> None:
+    loop = asyncio.get_running_loop()
+    _batchers.pop(loop, None)
+    client = _clients.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+async def aclose() -> None:
+    """Fecha o cliente do event loop atual e grava o índice local, se houver (shutdown do app)."""
+    local = _local_index()
+    if local is not None:
+        await local.aclose()
+    await _close_loop()
+
+
+def save_index() -> bool:
+    """Grava o índice local agora, se ele mudou (fim de um script de carga); False se não gravou."""
+    local = _local_index()
+    return local.save() if local is not None else False
+
+
+def get_cache() -> Any:
+    """`EmbeddingCache` configurado por `EMBEDDING_CACHE_PATH`, ou None se desligado."""
+    global _cache
+    if _cache is None and EMBEDDING_CACHE_PATH:
+        from ..embedding_cache import EmbeddingCache
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH,
+                    max_bytes=EMBEDDING_CACHE_MAX_MB << 20,
+                    readonly=EMBEDDING_CACHE_READONLY,
+                )
+    return _cache
+
+
+async def aget_cache() -> Any:
+    """Como `get_cache`; a abertura (que espera o lock de arquivo) roda fora do event loop."""
+    if _cache is not None or not EMBEDDING_CACHE_PATH:
+        return _cache
+    return await asyncio.to_thread(get_cache)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats() if _cache is not None else {}
+
+
+def _local_index() -> Any:
+    """Módulo `vector_index` quando `VECTOR_BACKEND=local`, senão None (serviço remoto)."""
+    if VECTOR_BACKEND != 'local':
+        return None
+    from . import vector_index
+
+    return vector_index
+
+
+def index_stats() -> Dict[str, Any]:
+    local = _local_index()
+    return {'backend': VECTOR_BACKEND, **(local.stats() if local is not None else {})}
+
+
+def _dedupe(paths: List[str]) -> List[str]:
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+def load_contract(path: Optional[str] = None) -> Dict[str, str]:
+    """Caminhos gravados para este EMBEDDING_URL (vazio se o arquivo não existe ou é de outro serviço)."""
+    try:
+        with open(path or EMBEDDING_CONTRACT_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('url') != EMBEDDING_URL.rstrip('/'):
+        return {}
+    return {k: v for k, v in (data.get('paths') or {}).items() if isinstance(v, str)}
+
+
+def save_contract(paths: Dict[str, str], path: Optional[str] = None) -> None:
+    """Grava o contrato de forma atômica (tmp + rename)."""
+    path = path or EMBEDDING_CONTRACT_PATH
+    data = {'url': EMBEDDING_URL.rstrip('/'), 'paths': paths, 'probed_at': time.time()}
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _contract() -> Dict[str, str]:
+    global _resolved
+    if _resolved is None:
+        _resolved = load_contract()
+    return _resolved
+
+
+def _remember(op: str, p: Optional[str]) -> None:
+    paths = _contract()
+    if p is None:
+        paths.pop(op, None)
+    else:
+        paths[op] = p
+    try:
+        save_contract(paths)
+    except OSError:
+        logger.warning('could not write embedding contract to %s', EMBEDDING_CONTRACT_PATH, exc_info=True)
+
+
+async def _apost(op: str, candidates: List[str], payload: Dict[str, Any]) -> httpx.Response:
+    """POST no caminho resolvido de `op`; sem ele (ou se ele sumiu), no primeiro candidato que responder 2xx."""
+    client = _get_client()
+    known = _contract().get(op)
+    if known is not None:
+        r = await client.post(_url(known), json=payload)
+        if r.status_code not in PATH_ERRORS:
+            r.raise_for_status()
+            return r
+        logger.info('embedding %s path %s answered %d; probing again', op, known, r.status_code)
+        _remember(op, None)
+    last_err: Optional[Exception] = None
+    for p in _dedupe(candidates):
         try:
-            url = _url(p)
-            r = requests.post(url, json=payload, timeout=10)
+            r = await client.post(_url(p), json=payload)
             r.raise_for_status()
-            body = r.json()
-            break
         except Exception as e:
             last_err = e
             continue
-    if body is None:
-        raise last_err
-    # suportar formatos variados
+        _remember(op, p)
+        return r
+    raise last_err
+
+
+def parse_embeddings(body: Any) -> List[List[float]]:
+    """Normaliza `{embeddings: [...]}` e `{data: [{embedding: [...]}, ...]}` (estilo OpenAI)."""
+    if not isinstance(body, dict):
+        return []
     if 'embeddings' in body:
         return body['embeddings']
     if 'data' in body:
-        # por exemplo: OpenAI-like { data: [ { embedding: [...] }, ... ] }
-        out = []
-        for item in body['data']:
-            if isinstance(item, dict) and 'embedding' in item:
-                out.append(item['embedding'])
-        return out
-    # fallback
+        return [item['embedding'] for item in body['data'] if isinstance(item, dict) and 'embedding' in item]
     return []
 
 
-def upsert_vector(id: Any, vector: List[float], metadata: Optional[Dict[str, Any]] = None) -> bool:
+def parse_matches(body: Any) -> List[Dict[str, Any]]:
+    """Normaliza `results`, `matches` ou `items`."""
+    if not isinstance(body, dict):
+        return []
+    if 'results' in body:
+        return body['results']
+    return body.get('matches') or body.get('items') or []
+
+
+async def _fetch_embeddings(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Pede embeddings para o serviço de embeddings.
+
+    Assunção de contrato (ajustar conforme implementação do serviço):
+    POST {EMBEDDING_URL}/v1/embeddings
+    body: { "inputs": [..], "model": "..." }
+    response: { "embeddings": [[...], ...] }
+    """
+    payload: Dict[str, Any] = {'inputs': texts}
+    if model:
+        payload['model'] = model
+    r = await _apost('embed', EMBED_CANDIDATES, payload)
+    return parse_embeddings(r.json())
+
+
+async def aget_embedding(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Embeddings de `texts`: do cache quando houver, do serviço para o restante."""
+    cache = await aget_cache()
+    if cache is None:
+        return await _fetch_embeddings(texts, model)
+    cached = cache.get_many(texts, model, blocking=False)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    out: List[Any] = [None if v is None else v.tolist() for v in cached]
+    if not missing:
+        return out
+    fetched = await _fetch_embeddings([texts[i] for i in missing], model)
+    if len(fetched) != len(missing):
+        if len(missing) == len(texts):
+            return fetched  # resposta fora do contrato: devolve como veio, sem cachear
+        raise ValueError(f'embedding service returned {len(fetched)} vectors for {len(missing)} texts')
+    try:
+        await asyncio.to_thread(cache.put_many, [texts[i] for i in missing], fetched, model)
+    except OSError:
+        logger.warning('could not write to the embedding cache %s', cache.path, exc_info=True)
+    for i, v in zip(missing, fetched):
+        out[i] = v
+    return out
+
+
+async def aupsert_vector(id: Any, vector: List[float], metadata: Optional[Dict[str, Any]] = None) -> bool:
     """Insere/atualiza vetor no serviço.
 
     Assunção: POST {EMBEDDING_URL}/v1/upsert { items: [{id, vector, metadata}] }
     """
-    candidates = [EMBEDDING_UPSERT_PATH, '/v1/upsert', '/upsert', '/v1/collections/upsert']
+    local = _local_index()
+    if local is not None:
+        return await local.aupsert_vector(id, vector, metadata)
     payload = {'items': [{'id': id, 'vector': vector, 'metadata': metadata or {}}]}
-    last_err = None
-    for p in candidates:
+    r = await _apost('upsert', UPSERT_CANDIDATES, payload)
+    return r.status_code == 200
+
+
+def _upsert_item(item: Any) -> Dict[str, Any]:
+    """Aceita `{id, vector, metadata}` ou `(id, vector[, metadata])`; vetores NumPy viram listas."""
+    if isinstance(item, dict):
+        id, vector, metadata = item['id'], item['vector'], item.get('metadata')
+    else:
+        id, vector, metadata = (tuple(item) + (None,))[:3]
+    if hasattr(vector, 'tolist'):
+        vector = vector.tolist()
+    if id is None or not isinstance(vector, (list, tuple)) or not vector:
+        raise ValueError('item needs an id and a non-empty vector')
+    return {'id': id, 'vector': vector, 'metadata': metadata or {}}
+
+
+def _invalid_status(raw: Any, error: Exception) -> Dict[str, Any]:
+    """Status de um item malformado: só ele falha, a carga continua."""
+    try:
+        id = raw.get('id') if isinstance(raw, dict) else tuple(raw)[0]
+    except Exception:
+        id = None
+    return {'id': id, 'ok': False, 'error': f'invalid item: {type(error).__name__}: {error}'}
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+async def _upsert_batch(batch: List[Dict[str, Any]], retries: int) -> Optional[str]:
+    """Envia um lote; devolve None em caso de sucesso ou a mensagem do último erro."""
+    for attempt in range(retries + 1):
         try:
-            url = _url(p)
-            r = requests.post(url, json=payload, timeout=10)
-            r.raise_for_status()
-            return r.status_code == 200
+            await _apost('upsert', UPSERT_CANDIDATES, {'items': batch})
+            return None
         except Exception as e:
-            last_err = e
-            continue
-    raise last_err
+            if attempt == retries or not _retryable(e):
+                logger.warning('upsert of %d vectors failed: %s', len(batch), e)
+                return f'{type(e).__name__}: {e}'
+            await asyncio.sleep(EMBEDDING_UPSERT_BACKOFF * 2 ** attempt)
+    return None
 
 
-def search_vector(vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
+async def aupsert_vectors(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    batch_size: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Insere/atualiza vetores em lotes; devolve `[{id, ok, error}]` na ordem de entrada.
+
+    Os itens são consumidos sob demanda: no máximo `concurrency` lotes ficam em memória.
+    Um item malformado (sem `id`, sem vetor, metadata não serializável) recebe status de
+    erro e não é enviado; os demais seguem normalmente.
+    """
+    local = _local_index()
+    if local is not None:
+        return await local.aupsert_vectors(items)
+    batch_size = max(1, batch_size or EMBEDDING_UPSERT_BATCH)
+    max_bytes = max_bytes or EMBEDDING_UPSERT_MAX_BYTES
+    retries = EMBEDDING_UPSERT_RETRIES if retries is None else retries
+    slots = asyncio.Semaphore(max(1, concurrency or EMBEDDING_UPSERT_CONCURRENCY))
+    statuses: List[Dict[str, Any]] = []
+    tasks: set = set()
+
+    async def send(batch: List[Dict[str, Any]], batch_statuses: List[Dict[str, Any]]) -> None:
+        try:
+            error = await _upsert_batch(batch, retries)
+        finally:
+            slots.release()
+        for st in batch_statuses:
+            st['ok'] = error is None
+            st['error'] = error
+
+    batch: List[Dict[str, Any]] = []
+    batch_statuses: List[Dict[str, Any]] = []
+    size = 0
+
+    async def flush() -> None:
+        nonlocal batch, batch_statuses, size
+        await slots.acquire()
+        task = asyncio.ensure_future(send(batch, batch_statuses))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        batch, batch_statuses, size = [], [], 0
+
+    async def source():
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                yield item
+        else:
+            for item in items:
+                yield item
+
+    try:
+        async for raw in source():
+            try:
+                item = _upsert_item(raw)
+                item_size = len(json.dumps(item, ensure_ascii=False)) + 1
+            except Exception as e:
+                statuses.append(_invalid_status(raw, e))
+                continue
+            if batch and (len(batch) >= batch_size or size + item_size > max_bytes):
+                await flush()
+            batch.append(item)
+            size += item_size
+            st = {'id': item['id'], 'ok': False, 'error': None}
+            statuses.append(st)
+            batch_statuses.append(st)
+        if batch:
+            await flush()
+        if tasks:
+            await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return statuses
+
+
+async def asearch_vector(vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
     """Busca vetores similares.
 
     Assunção: POST {EMBEDDING_URL}/v1/search { vector, top_k }
     resposta esperada: { results: [ { id, score, metadata }, ... ] }
     """
-    candidates = [EMBEDDING_SEARCH_PATH, '/v1/search', '/search', '/v1/query', '/query']
-    payload = {'vector': vector, 'top_k': top_k}
-    body = None
-    last_err = None
-    for p in candidates:
+    local = _local_index()
+    if local is not None:
+        return await local.asearch_vector(vector, top_k)
+    r = await _apost('search', SEARCH_CANDIDATES, {'vector': vector, 'top_k': top_k})
+    return parse_matches(r.json())
+
+
+def _get_batcher(model: Optional[str]) -> MicroBatcher:
+    loop = asyncio.get_running_loop()
+    per_model = _batchers.get(loop)
+    if per_model is None:
+        per_model = _batchers[loop] = {}
+    key = model or ''
+    batcher = per_model.get(key)
+    if batcher is None:
+        async def handler(texts: List[str]) -> List[List[float]]:
+            return await aget_embedding(texts, model)
+
+        batcher = per_model[key] = MicroBatcher(
+            handler,
+            max_batch_size=EMBEDDING_BATCH_SIZE,
+            max_wait=EMBEDDING_BATCH_WAIT_MS / 1000.0,
+            max_weight=EMBEDDING_BATCH_TOKENS,
+            weigh=lambda text: max(1, estimate_tokens(text)),
+        )
+    return batcher
+
+
+async def aembed(text: str, model: Optional[str] = None) -> List[float]:
+    """Embedding de um texto, agrupado com os pedidos concorrentes numa só requisição."""
+    cache = await aget_cache()
+    if cache is not None:
+        v = cache.get(text, model, blocking=False)
+        if v is not None:
+            return v.tolist()
+    return await _get_batcher(model).submit(text)
+
+
+async def aembed_many(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Como `aembed` para vários textos; eles podem dividir lote com outros chamadores."""
+    batcher = _get_batcher(model)
+    return list(await asyncio.gather(*(batcher.submit(t) for t in texts)))
+
+
+def batch_stats() -> Dict[str, Any]:
+    """Contadores dos agrupadores do loop atual, por modelo ('default' = sem modelo)."""
+    try:
+        per_model = _batchers.get(asyncio.get_running_loop()) or {}
+    except RuntimeError:
+        return {}
+    return {key or 'default': b.stats() for key, b in per_model.items()}
+
+
+def _run(coro):
+    """Executa uma corrotina do adapter num loop próprio e fecha o cliente dela ao final.
+
+    O índice local não é gravado aqui: scripts chamam `save_index()` ao terminar.
+    """
+    async def runner():
         try:
-            url = _url(p)
-            r = requests.post(url, json=payload, timeout=10)
-            r.raise_for_status()
-            body = r.json()
-            break
-        except Exception as e:
-            last_err = e
-            continue
-    if body is None:
-        raise last_err
-    if 'results' in body:
-        return body['results']
-    return body.get('matches') or body.get('items') or []
+            return await coro
+        finally:
+            await _close_loop()
+
+    return asyncio.run(runner())
+
+
+def get_embedding(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Versão síncrona de `aget_embedding` (para scripts)."""
+    return _run(aget_embedding(texts, model))
+
+
+def upsert_vector(id: Any, vector: List[float], metadata: Optional[Dict[str, Any]] = None) -> bool:
+    """Versão síncrona de `aupsert_vector` (para scripts)."""
+    return _run(aupsert_vector(id, vector, metadata))
+
+
+def upsert_vectors(items: Iterable[Any], **kwargs) -> List[Dict[str, Any]]:
+    """Versão síncrona de `aupsert_vectors` (para scripts de carga)."""
+    return _run(aupsert_vectors(items, **kwargs))
+
+
+def search_vector(vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
+    """Versão síncrona de `asearch_vector` (para scripts)."""
+    return _run(asearch_vector(vector, top_k))
@@ -1,15 +1,20 @@
 """Probe utility to discover embedding service HTTP contract.
 
 Usage:
-  python3 -m polaris.adapters.probe_embedding_contract
+  python3 -m polaris.adapters.probe_embedding_contract [--write]
 
 It will try common endpoints for embeddings, upsert and search and print status and a small
-sample of the JSON response to help adapt the main adapter.
+sample of the JSON response to help adapt the main adapter. With --write, the first path
+that answers 2xx for each operation is saved to the adapter's contract file
+(EMBEDDING_CONTRACT_PATH), so the service never has to probe at runtime.
 """
+import argparse
 import os
 import requests
 import json
 
+from polaris.adapters.embeddings import save_contract
+
 EMBEDDING_URL = os.getenv('EMBEDDING_URL', 'http://localhost:8001')
 
 EMBED_PATHS = ['/v1/embeddings', '/embeddings', '/v1/embed', '/embed']
@@ -31,6 +36,8 @@ def try_post(path, payload):
 
 
 def probe_embeddings():
+    """Print what every candidate path answers; returns the first working path per operation."""
+    resolved = {}
     print('Probing embedding endpoints on', EMBEDDING_URL)
     samples = {
         'embed': {'inputs': ['hello world']},
@@ -42,6 +49,8 @@ def probe_embeddings():
     for p in EMBED_PATHS:
         res = try_post(p, samples['embed'])
         print(p, '->', res.get('status') if res.get('ok') else 'ERR', res.get('error') if not res.get('ok') else '')
+        if res.get('ok') and 200 <= res['status'] < 300:
+            resolved.setdefault('embed', p)
         if res.get('ok'):
             body = res.get('body')
             print('  sample keys:', list(body.keys()) if isinstance(body, dict) else type(body))
@@ -50,6 +59,8 @@ def probe_embeddings():
     for p in UPSERT_PATHS:
         res = try_post(p, samples['upsert'])
         print(p, '->', res.get('status') if res.get('ok') else 'ERR', res.get('error') if not res.get('ok') else '')
+        if res.get('ok') and 200 <= res['status'] < 300:
+            resolved.setdefault('upsert', p)
         if res.get('ok'):
             body = res.get('body')
             if isinstance(body, dict):
@@ -61,6 +72,8 @@ def probe_embeddings():
     for p in SEARCH_PATHS:
         res = try_post(p, samples['search'])
         print(p, '->', res.get('status') if res.get('ok') else 'ERR', res.get('error') if not res.get('ok') else '')
+        if res.get('ok') and 200 <= res['status'] < 300:
+            resolved.setdefault('search', p)
         if res.get('ok'):
             body = res.get('body')
             if isinstance(body, dict):
@@ -68,6 +81,16 @@ def probe_embeddings():
             else:
                 print('  response type:', type(body))
 
+    return resolved
+
 
 if __name__ == '__main__':
-    probe_embeddings()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write', action='store_true', help='save the working paths to the contract file')
+    parser.add_argument('--contract', default=None, help='contract file (default: EMBEDDING_CONTRACT_PATH)')
+    args = parser.parse_args()
+    resolved = probe_embeddings()
+    print('\nResolved:', resolved)
+    if args.write:
+        save_contract(resolved, args.contract)
+        print('Contract written to', args.contract or os.getenv('EMBEDDING_CONTRACT_PATH', 'embedding_contract.json'))
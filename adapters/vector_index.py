@@ -0,0 +1,416 @@
+"""Índice vetorial em processo (NumPy), backend local do vector store.
+
+Mesma interface de busca/upsert de `adapters/embeddings.py` (`aupsert_vector`,
+`aupsert_vectors`, `asearch_vector` e as versões síncronas), sem ida à rede. Com
+`VECTOR_BACKEND=local`, o adapter de embeddings delega para cá; os embeddings em si
+continuam vindo do serviço.
+
+Backends (`VECTOR_INDEX`):
+- `flat` (padrão): busca exata. Os vetores ficam normalizados numa matriz float32, então
+  o cosseno é um produto interno. A busca multiplica a matriz pelas consultas em blocos e
+  tira o top-k com `argpartition`.
+- `ivf`: busca aproximada para corpora grandes. K-means esférico agrupa os vetores em
+  `VECTOR_IVF_NLIST` listas (0 = raiz quadrada do total). A consulta varre só as
+  `VECTOR_IVF_NPROBE` listas com centróides mais próximos. O treino acontece na primeira
+  busca e é refeito quando o índice dobra de tamanho. Abaixo de `min_train` vetores a
+  busca é exata.
+
+`VECTOR_INDEX_PATH` persiste o índice (.npz): ele é carregado no primeiro uso e gravado
+em `aclose()` quando mudou. Requer o pacote opcional `numpy`.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .embeddings import _invalid_status, _upsert_item
+
+VECTOR_INDEX = os.getenv('VECTOR_INDEX', 'flat')
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH')
+VECTOR_IVF_NLIST = int(os.getenv('VECTOR_IVF_NLIST', '0'))
+VECTOR_IVF_NPROBE = int(os.getenv('VECTOR_IVF_NPROBE', '8'))
+
+# linhas da matriz por bloco de busca: limita a matriz de scores temporária
+SEARCH_BLOCK_ROWS = 65536
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors: Any) -> np.ndarray:
+    a = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(a, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return a / norms
+
+
+def _topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(colunas, scores) dos k maiores de cada linha, em ordem decrescente."""
+    if k < scores.shape[1]:
+        cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        cols = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    vals = np.take_along_axis(scores, cols, axis=1)
+    order = np.argsort(-vals, axis=1, kind='stable')
+    return np.take_along_axis(cols, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+class FlatIndex:
+    """Busca exata por cosseno sobre uma matriz float32 normalizada."""
+
+    kind = 'flat'
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self._count = 0
+        self._ids: List[Any] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._rows: Dict[Any, int] = {}
+        self._lock = threading.RLock()
+        self.searches = 0
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _reserve(self, n: int) -> None:
+        if n > len(self._vectors):
+            grown = np.empty((max(n, 2 * len(self._vectors), 1024), self.dim), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+
+    def upsert(self, ids: Sequence[Any], vectors: Any, metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None) -> int:
+        """Insere ou substitui vetores (por id); devolve quantos ids eram novos."""
+        m = _normalize(vectors)
+        if len(ids) != len(m):
+            raise ValueError(f'{len(ids)} ids for {len(m)} vectors')
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            if self.dim is None:
+                self.dim = m.shape[1]
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            if m.shape[1] != self.dim:
+                raise ValueError(f'expected {self.dim}-d vectors, got {m.shape[1]}-d')
+            rows = np.empty(len(ids), dtype=np.int64)
+            added = 0
+            for i, (id, meta) in enumerate(zip(ids, metadatas)):
+                row = self._rows.get(id)
+                if row is None:
+                    row = self._rows[id] = self._count + added
+                    self._ids.append(id)
+                    self._metadata.append(meta or {})
+                    added += 1
+                elif meta is not None:
+                    self._metadata[row] = meta
+                rows[i] = row
+            self._reserve(self._count + added)
+            self._vectors[rows] = m
+            self._count += added
+            self._updated(rows)
+            return added
+
+    def _updated(self, rows: np.ndarray) -> None:
+        """Gancho para índices derivados (listas do IVF)."""
+
+    def search(self, vector: Any, top_k: int = 10) -> List[Dict[str, Any]]:
+        return self.search_many([vector], top_k)[0]
+
+    def search_many(self, vectors: Any, top_k: int = 10) -> List[List[Dict[str, Any]]]:
+        """Top-k de várias consultas de uma vez (uma multiplicação de matrizes por bloco)."""
+        q = _normalize(vectors)
+        with self._lock:
+            self.searches += 1
+            self.queries += len(q)
+            if self._count == 0 or top_k <= 0:
+                return [[] for _ in range(len(q))]
+            rows, scores = self._search(q, min(top_k, self._count))
+            return [self._matches(r, s) for r, s in zip(rows, scores)]
+
+    def _search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows: Optional[np.ndarray] = None
+        best_scores: Optional[np.ndarray] = None
+        for start in range(0, self._count, SEARCH_BLOCK_ROWS):
+            block = self._vectors[start:min(self._count, start + SEARCH_BLOCK_ROWS)]
+            cols, scores = _topk(q @ block.T, k)
+            rows = cols + start
+            if best_rows is not None:
+                rows = np.concatenate([best_rows, rows], axis=1)
+                scores = np.concatenate([best_scores, scores], axis=1)
+                cols, scores = _topk(scores, k)
+                rows = np.take_along_axis(rows, cols, axis=1)
+            best_rows, best_scores = rows, scores
+        return best_rows, best_scores
+
+    def _matches(self, rows: Sequence[int], scores: Sequence[float]) -> List[Dict[str, Any]]:
+        return [
+            {'id': self._ids[r], 'score': float(s), 'metadata': self._metadata[r]}
+            for r, s in zip(rows, scores)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'kind': self.kind, 'vectors': self._count, 'dim': self.dim, 'searches': self.searches, 'queries': self.queries}
+
+    # -- persistência --
+
+    def save(self, path: str) -> None:
+        """Grava vetores, ids e metadados num .npz de forma atômica (tmp + rename)."""
+        with self._lock:
+            vectors = self._vectors[:self._count].copy()
+            extra = json.dumps({'ids': self._ids, 'metadata': self._metadata}, ensure_ascii=False).encode('utf-8')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, vectors=vectors, extra=np.frombuffer(extra, dtype=np.uint8))
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> int:
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data['vectors']
+            extra = json.loads(data['extra'].tobytes().decode('utf-8'))
+        if len(vectors):
+            self.upsert(extra['ids'], vectors, extra['metadata'])
+        return len(vectors)
+
+
+class IVFIndex(FlatIndex):
+    """Busca aproximada: listas invertidas sobre centróides de k-means esférico."""
+
+    kind = 'ivf'
+
+    def __init__(self, dim: Optional[int] = None, nlist: int = 0, nprobe: int = 8, min_train: int = 4096, seed: int = 0):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.min_train = min_train
+        self.seed = seed
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._trained_at = 0
+        self._order: Optional[np.ndarray] = None
+        self._bounds: Optional[np.ndarray] = None
+        self.trainings = 0
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = vectors[start:start + SEARCH_BLOCK_ROWS]
+            out[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        return out
+
+    def _updated(self, rows: np.ndarray) -> None:
+        if self._centroids is None:
+            return
+        if len(self._assign) < len(self._vectors):
+            grown = np.zeros(len(self._vectors), dtype=np.int32)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+        self._assign[rows] = self._nearest(self._vectors[rows])
+        self._order = None
+
+    def train(self, iterations: int = 10) -> None:
+        """K-means esférico numa amostra (até 64 vetores por lista) e reatribuição de todos."""
+        with self._lock:
+            n = self._count
+            if n == 0:
+                return
+            nlist = min(n, self.nlist or max(1, int(np.sqrt(n))))
+            rng = np.random.default_rng(self.seed)
+            sample = self._vectors[np.sort(rng.choice(n, min(n, 64 * nlist), replace=False))]
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                self._centroids = centroids
+                assign = self._nearest(sample)
+                order = np.argsort(assign, kind='stable')
+                counts = np.bincount(assign, minlength=nlist)
+                sums = np.zeros_like(centroids)
+                present = np.flatnonzero(counts)
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+                sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+                empty = counts == 0
+                if empty.any():  # lista vazia: recomeça de um ponto qualquer da amostra
+                    sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                centroids = _normalize(sums)
+            self._centroids = centroids
+            self._assign = np.zeros(len(self._vectors), dtype=np.int32)
+            self._assign[:n] = self._nearest(self._vectors[:n])
+            self._order = None
+            self._trained_at = n
+            self.trainings += 1
+
+    def _lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            assign = self._assign[:self._count]
+            self._order = np.argsort(assign, kind='stable')
+            self._bounds = np.searchsorted(assign[self._order], np.arange(len(self._centroids) + 1))
+        return self._order, self._bounds
+
+    def _search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._count < self.min_train:
+            return super()._search(q, k)
+        if self._centroids is None or self._count >= 2 * self._trained_at:
+            self.train()
+        order, bounds = self._lists()
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes, _ = _topk(q @ self._centroids.T, nprobe)
+        rows_out = np.full((len(q), k), -1, dtype=np.int64)
+        scores_out = np.full((len(q), k), -np.inf, dtype=np.float32)
+        for i, lists in enumerate(probes):
+            cand = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in lists])
+            if len(cand) == 0:
+                continue
+            cols, scores = _topk((self._vectors[cand] @ q[i])[None, :], min(k, len(cand)))
+            rows_out[i, :cols.shape[1]] = cand[cols[0]]
+            scores_out[i, :cols.shape[1]] = scores[0]
+        return rows_out, scores_out
+
+    def _matches(self, rows: Sequence[int], scores: Sequence[float]) -> List[Dict[str, Any]]:
+        keep = [(r, s) for r, s in zip(rows, scores) if r >= 0]
+        return super()._matches([r for r, _ in keep], [s for _, s in keep])
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update({
+            'nlist': 0 if self._centroids is None else len(self._centroids),
+            'nprobe': self.nprobe,
+            'trained_at': self._trained_at,
+            'trainings': self.trainings,
+        })
+        return out
+
+
+def build_index(kind: Optional[str] = None) -> FlatIndex:
+    kind = kind or VECTOR_INDEX
+    if kind == 'flat':
+        return FlatIndex()
+    if kind == 'ivf':
+        return IVFIndex(nlist=VECTOR_IVF_NLIST, nprobe=VECTOR_IVF_NPROBE)
+    raise ValueError(f'unknown VECTOR_INDEX: {kind}')
+
+
+# índice do processo (compartilhado entre loops e threads); criado no primeiro uso
+_index: Optional[FlatIndex] = None
+_dirty = False
+
+
+def get_index() -> FlatIndex:
+    global _index
+    if _index is None:
+        index = build_index()
+        if VECTOR_INDEX_PATH and os.path.exists(VECTOR_INDEX_PATH):
+            count = index.load(VECTOR_INDEX_PATH)
+            logger.info('loaded %d vectors from %s', count, VECTOR_INDEX_PATH)
+        _index = index
+    return _index
+
+
+def upsert_vector(id: Any, vector: Sequence[float], metadata: Optional[Dict[str, Any]] = None) -> bool:
+    global _dirty
+    get_index().upsert([id], [vector], [metadata or {}])
+    _dirty = True
+    return True
+
+
+def _upsert_chunk(chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """Grava um bloco de `(item, status)` e preenche os status."""
+    global _dirty
+    items = [it for it, _ in chunk]
+    try:
+        get_index().upsert([it['id'] for it in items], [it['vector'] for it in items], [it['metadata'] for it in items])
+        error = None
+        _dirty = True
+    except ValueError as e:
+        error = f'{type(e).__name__}: {e}'
+    for _, st in chunk:
+        st['ok'] = error is None
+        st['error'] = error
+
+
+def _add_item(raw: Any, chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]], statuses: List[Dict[str, Any]]) -> None:
+    try:
+        item = _upsert_item(raw)
+    except Exception as e:
+        statuses.append(_invalid_status(raw, e))
+        return
+    st = {'id': item['id'], 'ok': False, 'error': None}
+    statuses.append(st)
+    chunk.append((item, st))
+
+
+def upsert_vectors(items: Iterable[Any], batch_size: int = 4096, **_ignored) -> List[Dict[str, Any]]:
+    """Carga em massa; `{id, ok, error}` por item, como `embeddings.aupsert_vectors`."""
+    statuses: List[Dict[str, Any]] = []
+    chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for raw in items:
+        _add_item(raw, chunk, statuses)
+        if len(chunk) >= batch_size:
+            _upsert_chunk(chunk)
+            chunk = []
+    if chunk:
+        _upsert_chunk(chunk)
+    return statuses
+
+
+def search_vector(vector: Sequence[float], top_k: int = 10) -> List[Dict[str, Any]]:
+    return get_index().search(vector, top_k)
+
+
+def search_vectors(vectors: Sequence[Sequence[float]], top_k: int = 10) -> List[List[Dict[str, Any]]]:
+    return get_index().search_many(vectors, top_k)
+
+
+async def aupsert_vector(id: Any, vector: Sequence[float], metadata: Optional[Dict[str, Any]] = None) -> bool:
+    return upsert_vector(id, vector, metadata)
+
+
+async def aupsert_vectors(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    batch_size: int = 4096,
+    **_ignored,
+) -> List[Dict[str, Any]]:
+    if not hasattr(items, '__aiter__'):
+        return await asyncio.to_thread(upsert_vectors, items, batch_size)
+    statuses: List[Dict[str, Any]] = []
+    chunk: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    async for raw in items:
+        _add_item(raw, chunk, statuses)
+        if len(chunk) >= batch_size:
+            await asyncio.to_thread(_upsert_chunk, chunk)
+            chunk = []
+    if chunk:
+        await asyncio.to_thread(_upsert_chunk, chunk)
+    return statuses
+
+
+async def asearch_vector(vector: Sequence[float], top_k: int = 10) -> List[Dict[str, Any]]:
+    # numpy solta o GIL na multiplicação: a busca roda numa thread sem travar o loop
+    return await asyncio.to_thread(search_vector, vector, top_k)
+
+
+async def asearch_vectors(vectors: Sequence[Sequence[float]], top_k: int = 10) -> List[List[Dict[str, Any]]]:
+    return await asyncio.to_thread(search_vectors, vectors, top_k)
+
+
+def save(path: Optional[str] = None) -> bool:
+    """Grava o índice em `path` (ou `VECTOR_INDEX_PATH`) se ele mudou desde o último save."""
+    global _dirty
+    path = path or VECTOR_INDEX_PATH
+    if _index is None or not path or not _dirty:
+        return False
+    _dirty = False
+    try:
+        _index.save(path)
+    except BaseException:
+        _dirty = True
+        raise
+    return True
+
+
+async def aclose() -> None:
+    await asyncio.to_thread(save)
+
+
+def stats() -> Dict[str, Any]:
+    return _index.stats() if _index is not None else {}
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict, Any
-import time
+from contextlib import asynccontextmanager
 import json
 
 from .agent import PolarisAgent
+from .limiter import LLMOverloaded
+from .prompting import build_chat_prompt
 from .schemas import (
     HealthResponse,
     SessionCreate,
@@ -20,7 +23,23 @@ from .schemas import (
     EstimateResponse,
 )
 
-app = FastAPI(title="POLARIS Agent API")
+agent = PolarisAgent()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the agent's pooled upstream client on startup and close it on shutdown."""
+    await agent.start()  # restores the session snapshot, if configured (logged by the snapshotter)
+    try:
+        yield
+    finally:
+        await agent.aclose()
+        if agent.cache is not None:
+            agent.cache.close()
+        agent.sessions.close()
+
+
+app = FastAPI(title="POLARIS Agent API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,12 +49,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-agent = PolarisAgent()
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    """Shed load fast when the LLM backend is saturated instead of queueing until timeout."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "llm_overloaded"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/api/v1/health", response_model=HealthResponse)
 async def health():
     return await agent.health_check()
 
+@app.get("/api/v1/metrics")
+async def metrics():
+    return agent.metrics()
+
 @app.post("/api/v1/sessions", response_model=SessionResponse)
 async def create_session(body: SessionCreate):
     sid = agent.create_session(client_id=body.client_id, metadata=body.metadata)
@@ -48,12 +78,13 @@ async def update_session_slots(session_id: str, slots: Dict[str, Any]):
     This endpoint is intentionally permissive and designed for debugging and tests. In
     production, restrict to authenticated clients and validate fields.
     """
-    s = agent.sessions.get(session_id)
-    if not s:
+    try:
+        async with agent.sessions.edit(session_id) as s:
+            current = s.get("slots") or {}
+            current.update(slots)
+            s["slots"] = current
+    except KeyError:
         raise HTTPException(status_code=404, detail="session not found")
-    current = s.get("slots") or {}
-    current.update(slots)
-    s["slots"] = current
     return {"session_id": session_id, "slots": s["slots"]}
 
 @app.post("/api/v1/discovery", response_model=DiscoveryResponse)
@@ -97,20 +128,26 @@ async def chat_endpoint(body: dict):
         session_id = agent.create_session()
 
     # record the user turn
-    s = agent.sessions.get(session_id)
-    if s is None:
+    try:
+        async with agent.sessions.edit(session_id) as s:
+            history = list(s.get("turns") or [])
+            agent.append_turn(s, "client", msg)
+    except KeyError:
         raise HTTPException(status_code=404, detail="session not found")
-    s.setdefault("turns", []).append({"from": "client", "text": msg, "ts": time.time()})
 
-    # Build a simple prompt for the LLM that asks for a short, human reply.
-    prompt = f"You are a helpful assistant. Reply in a concise, friendly and human tone to the user message: \"{msg}\""
-    llm_res = await agent.call_llm(prompt, max_tokens=256, temperature=0.7)
+    # Build a token-budgeted prompt: instruction, message, then the most recent history that fits.
+    prompt = build_chat_prompt(msg, history, s.get("summary"))
+    llm_res = await agent.call_llm(prompt, temperature=0.7, task="chat")
     if not llm_res.get("ok"):
         raise HTTPException(status_code=502, detail="llm_error")
     text = llm_res.get("text") or ""
 
-    # record assistant turn
-    s.setdefault("turns", []).append({"from": "assistant", "text": text, "ts": time.time()})
+    # record assistant turn (the session lock is not held across the LLM call)
+    try:
+        async with agent.sessions.edit(session_id) as s:
+            agent.append_turn(s, "assistant", text)
+    except KeyError:
+        pass  # session expired or was evicted meanwhile; the reply is still returned
 
     return {"response": text, "session_id": session_id}
 
@@ -153,27 +190,24 @@ async def websocket_chat(websocket: WebSocket):
                 })
 
             # Record user turn
-            s = agent.sessions.get(session_id)
-            if s is None:
+            try:
+                async with agent.sessions.edit(session_id) as s:
+                    history = list(s.get("turns") or [])
+                    agent.append_turn(s, "client", message)
+            except KeyError:
                 await websocket.send_json({
                     'type': 'error',
                     'error': 'Session not found'
                 })
                 continue
 
-            s.setdefault("turns", []).append({
-                "from": "client",
-                "text": message,
-                "ts": time.time()
-            })
-
-            # Build prompt for LLM
-            prompt = f"You are a helpful assistant. Reply in a concise, friendly and human tone to the user message: \"{message}\""
+            # Build a token-budgeted prompt for the LLM
+            prompt = build_chat_prompt(message, history, s.get("summary"))
 
             # Stream response
             full_response = ""
             try:
-                async for chunk in agent.call_llm_stream(prompt, max_tokens=512, temperature=0.7):
+                async for chunk in agent.call_llm_stream(prompt, temperature=0.7, task="chat"):
                     if chunk['type'] == 'token':
                         full_response += chunk['text']
                         await websocket.send_json({
@@ -183,11 +217,11 @@ async def websocket_chat(websocket: WebSocket):
                         })
                     elif chunk['type'] == 'done':
                         # Record assistant turn
-                        s.setdefault("turns", []).append({
-                            "from": "assistant",
-                            "text": full_response,
-                            "ts": time.time()
-                        })
+                        try:
+                            async with agent.sessions.edit(session_id) as s:
+                                agent.append_turn(s, "assistant", full_response)
+                        except KeyError:
+                            pass
                         await websocket.send_json({
                             'type': 'done',
                             'full_response': full_response,
@@ -195,10 +229,10 @@ async def websocket_chat(websocket: WebSocket):
                         })
                         break
                     elif chunk['type'] == 'error':
-                        await websocket.send_json({
-                            'type': 'error',
-                            'error': chunk['error']
-                        })
+                        err = {'type': 'error', 'error': chunk['error']}
+                        if 'retry_after' in chunk:
+                            err['retry_after'] = chunk['retry_after']
+                        await websocket.send_json(err)
                         break
 
             except Exception as e:
@@ -0,0 +1,112 @@
+"""Client-side load balancing across LLM replicas.
+
+Each request goes to the healthy replica with the lowest expected cost,
+`(outstanding + 1) * latency_ewma`: least-outstanding-requests weighted by how fast the
+replica has been answering, so a slow replica naturally receives less traffic.
+Replicas are ejected passively after `eject_after` consecutive errors, for a cool-down
+that doubles on every repeated ejection (capped at `max_eject_time`). If every replica
+is ejected the balancer still picks one (the one due back soonest) rather than failing.
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Replica:
+    __slots__ = ('url', 'outstanding', 'latency_ewma', 'consecutive_errors', 'ejected_until',
+                 'ejections', 'requests', 'failures')
+
+    def __init__(self, url: str, initial_latency: float):
+        self.url = url
+        self.outstanding = 0
+        self.latency_ewma = initial_latency
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.requests = 0
+        self.failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'outstanding': self.outstanding,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 2),
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejected': self.ejected_until > time.monotonic(),
+            'ejections': self.ejections,
+        }
+
+
+class Balancer:
+    def __init__(
+        self,
+        urls: List[str],
+        eject_after: int = 3,
+        eject_time: float = 10.0,
+        max_eject_time: float = 120.0,
+        alpha: float = 0.2,
+        initial_latency: float = 0.5,
+    ):
+        if not urls:
+            raise ValueError('at least one replica URL is required')
+        self.replicas = [Replica(u.rstrip('/'), initial_latency) for u in urls]
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.alpha = alpha
+
+    @classmethod
+    def from_env_value(cls, value: str, **kwargs) -> 'Balancer':
+        """Build from a comma/whitespace separated list such as LLM_URL."""
+        urls = [u for u in value.replace(',', ' ').split() if u]
+        return cls(urls, **kwargs)
+
+    @property
+    def primary_url(self) -> str:
+        return self.replicas[0].url
+
+    def pick(self) -> Replica:
+        now = time.monotonic()
+        best: Optional[Replica] = None
+        best_cost = 0.0
+        for r in self.replicas:
+            if r.ejected_until > now:
+                continue
+            cost = (r.outstanding + 1) * r.latency_ewma
+            if best is None or cost < best_cost:
+                best, best_cost = r, cost
+        if best is None:
+            best = min(self.replicas, key=lambda r: r.ejected_until)
+        return best
+
+    def acquire(self) -> Replica:
+        r = self.pick()
+        r.outstanding += 1
+        r.requests += 1
+        return r
+
+    def release(self, r: Replica, latency: Optional[float], ok: Optional[bool]) -> None:
+        """Return a replica.
+
+        `ok=None` (cancelled/shed) records nothing about its health; `latency=None`
+        records the outcome without feeding the latency average (e.g. streams).
+        """
+        r.outstanding -= 1
+        if ok is None:
+            return
+        if ok:
+            if latency is not None:
+                r.latency_ewma += self.alpha * (latency - r.latency_ewma)
+            r.consecutive_errors = 0
+            r.ejections = 0
+            return
+        r.failures += 1
+        r.consecutive_errors += 1
+        if r.consecutive_errors >= self.eject_after:
+            r.ejections += 1
+            cool_down = min(self.max_eject_time, self.eject_time * (2 ** (r.ejections - 1)))
+            r.ejected_until = time.monotonic() + cool_down
+            r.consecutive_errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {r.url: r.stats() for r in self.replicas}
@@ -0,0 +1,109 @@
+"""Micro-batching helper: collect concurrent submissions and process them together.
+
+A batch is flushed when it reaches `max_batch_size` items (or, with a `weigh` function,
+`max_weight` total weight, e.g. tokens) or when the oldest pending item has waited
+`max_wait` seconds, whichever comes first. The handler receives the list of items and
+must return a list of results in the same order.
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait: float = 0.02,
+        max_weight: Optional[int] = None,
+        weigh: Optional[Callable[[Any], int]] = None,
+    ):
+        self.handler = handler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_weight = max_weight if weigh is not None else None
+        self.weigh = weigh
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._weights: List[int] = []
+        self._pending_weight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.batches = 0
+        self.items = 0
+        self.size_histogram: Counter = Counter()
+        self.weight_total = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if self.max_weight is not None:
+            w = self.weigh(item)
+            self._weights.append(w)
+            self._pending_weight += w
+        if len(self._pending) >= self.max_batch_size or (
+            self.max_weight is not None and self._pending_weight >= self.max_weight
+        ):
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            n = self._next_batch_len()
+            batch = self._pending[:n]
+            del self._pending[:n]
+            if self.max_weight is not None:
+                weight = sum(self._weights[:n])
+                del self._weights[:n]
+                self._pending_weight -= weight
+                self.weight_total += weight
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _next_batch_len(self) -> int:
+        n = min(len(self._pending), self.max_batch_size)
+        if self.max_weight is None:
+            return n
+        total = 0
+        for i in range(n):
+            total += self._weights[i]
+            if total > self.max_weight and i > 0:  # an oversized item still goes alone
+                return i
+        return n
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        self.size_histogram[len(batch)] += 1
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'batch handler returned {len(results)} results for {len(batch)} items')
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    def stats(self) -> Dict[str, Any]:
+        out = {
+            'batches': self.batches,
+            'items': self.items,
+            'pending': len(self._pending),
+            'avg_batch_size': (self.items / self.batches) if self.batches else 0.0,
+            'batch_sizes': dict(sorted(self.size_histogram.items())),
+        }
+        if self.max_weight is not None:
+            out['avg_batch_weight'] = (self.weight_total / self.batches) if self.batches else 0.0
+        return out
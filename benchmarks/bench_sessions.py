@@ -0,0 +1,77 @@
+"""Benchmark: memory of N sessions x M turns, dict layout vs `Session`/`TurnLog`.
+
+Usage:
+  python3 -m polaris.benchmarks.bench_sessions [--sessions N] [--turns M]
+
+Measures the heap allocated (tracemalloc) to build the same history in the old layout
+(a dict per session holding a list of `{'from', 'text', 'ts'}` dicts) and in the
+columnar layout, with short repeated replies mixed into unique user texts.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from polaris.session_model import Session
+
+REPLIES = ['Entendi.', 'Pode detalhar?', 'Qual a métrica de sucesso principal (ex.: conversão, retenção)?']
+
+
+def turns(s: int, m: int):
+    for t in range(m):
+        if t % 2 == 0:
+            yield {'from': 'client', 'text': f'sessão {s} mensagem {t} sobre o projeto', 'ts': 1.7e9 + t}
+        else:
+            yield {'from': 'assistant', 'text': REPLIES[t % len(REPLIES)], 'ts': 1.7e9 + t}
+
+
+def build_dicts(n: int, m: int):
+    out = {}
+    for s in range(n):
+        sid = f'sid-{s}'
+        sess = {'session_id': sid, 'client_id': None, 'metadata': {}, 'turns': [], 'created_at': 1.7e9}
+        for turn in turns(s, m):
+            sess['turns'].append(dict(turn))
+        out[sid] = sess
+    return out
+
+
+def build_sessions(n: int, m: int):
+    out = {}
+    for s in range(n):
+        sid = f'sid-{s}'
+        sess = Session(sid, created_at=1.7e9, max_turns=m)
+        for turn in turns(s, m):
+            sess['turns'].append(turn)
+        out[sid] = sess
+    return out
+
+
+def measure(build, n: int, m: int):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = build(n, m)
+    elapsed = time.perf_counter() - start
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size, elapsed
+
+
+def run(n: int, m: int) -> None:
+    print(f'{n} sessions x {m} turns')
+    base = None
+    for name, build in (('dict layout', build_dicts), ('Session/TurnLog', build_sessions)):
+        size, elapsed = measure(build, n, m)
+        base = base or size
+        print(f'{name:16s} {size / 1e6:8.1f} MB  {size / (n * m):6.0f} B/turn  '
+              f'{elapsed:.2f}s  ({size / base:.0%} of dict layout)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=10_000)
+    parser.add_argument('--turns', type=int, default=50)
+    args = parser.parse_args()
+    run(args.sessions, args.turns)
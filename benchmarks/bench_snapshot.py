@@ -0,0 +1,44 @@
+"""Benchmark: write and stream-restore a session snapshot.
+
+Usage:
+  python3 -m polaris.benchmarks.bench_snapshot [--sessions N] [--turns M] [--path FILE]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from polaris.session_model import Session
+from polaris.sessions import MemorySessionStore
+from polaris.snapshot import restore_snapshot, write_snapshot
+
+
+def run(n: int, m: int, path: str) -> None:
+    store = MemorySessionStore(max_entries=2 * n)
+    for i in range(n):
+        sid = f'{i:032x}'
+        s = Session(sid, client_id='bench', created_at=1.7e9, slots={'kpi': 'conversão'})
+        for t in range(m):
+            s['turns'].append({'from': 'client' if t % 2 == 0 else 'assistant', 'text': f'mensagem {t} da sessão {i}', 'ts': 1.7e9 + t})
+        store.put(sid, s)
+
+    start = time.perf_counter()
+    write_snapshot(store, path)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f'write:   {n} sessions x {m} turns in {elapsed:.2f}s ({size / 1e6:.1f} MB, {size / n:.0f} B/session)')
+
+    restored = MemorySessionStore(max_entries=2 * n)
+    start = time.perf_counter()
+    count = restore_snapshot(restored, path)
+    elapsed = time.perf_counter() - start
+    print(f'restore: {count} sessions in {elapsed:.2f}s ({count / elapsed:,.0f} sessions/s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=1_000_000)
+    parser.add_argument('--turns', type=int, default=4)
+    parser.add_argument('--path', default=os.path.join(tempfile.gettempdir(), 'polaris-bench.snap'))
+    args = parser.parse_args()
+    run(args.sessions, args.turns, args.path)
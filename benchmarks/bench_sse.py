@@ -0,0 +1,56 @@
+"""Benchmark: stream 100k SSE tokens through the decoder and the agent's token mapping.
+
+Usage:
+  python3 -m polaris.benchmarks.bench_sse [--tokens N] [--chunk BYTES]
+
+Builds a gemini-wrapper-like SSE body in memory, slices it into fixed-size network
+chunks (so lines and UTF-8 sequences get split) and measures tokens/s end to end.
+"""
+import argparse
+import json
+import time
+
+from polaris.agent_core import PolarisAgent
+from polaris.sse import JSON_BACKEND, SSEDecoder
+
+
+def build_stream(tokens: int) -> bytes:
+    parts = []
+    for i in range(tokens):
+        parts.append(b'data: ' + json.dumps({'text': f'tok{i} ção '}).encode('utf-8') + b'\n\n')
+    parts.append(b'data: [DONE]\n\n')
+    return b''.join(parts)
+
+
+def run(tokens: int, chunk: int) -> None:
+    body = build_stream(tokens)
+    chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+    print(f'json backend: {JSON_BACKEND}; {len(body) / 1e6:.1f} MB in {len(chunks)} chunks')
+
+    decoder = SSEDecoder()
+    start = time.perf_counter()
+    count = 0
+    for c in chunks:
+        count += len(decoder.feed(c))
+    elapsed = time.perf_counter() - start
+    print(f'decode only:        {count} events in {elapsed:.3f}s ({count / elapsed:,.0f} ev/s)')
+
+    decoder = SSEDecoder()
+    to_token = PolarisAgent._stream_token
+    start = time.perf_counter()
+    count = 0
+    for c in chunks:
+        for ev in decoder.feed(c):
+            tok = to_token(ev)
+            if tok:
+                count += 1
+    elapsed = time.perf_counter() - start
+    print(f'decode + tokens:    {count} tokens in {elapsed:.3f}s ({count / elapsed:,.0f} tok/s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=100_000)
+    parser.add_argument('--chunk', type=int, default=4096)
+    args = parser.parse_args()
+    run(args.tokens, args.chunk)
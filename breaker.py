@@ -0,0 +1,73 @@
+"""Circuit breaker for the LLM backend.
+
+closed    -> calls flow; `failure_threshold` consecutive failures open the circuit.
+open      -> calls are rejected without touching the network for `reset_timeout` s.
+half_open -> one probe call is let through; success closes the circuit, failure
+             re-opens it for another cool-down.
+"""
+
+import time
+from typing import Any, Dict
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probe_inflight = False
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (does not consume the half-open probe)."""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at < self.reset_timeout
+        return self.state == HALF_OPEN and self._probe_inflight
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_inflight = False
+        if self.state == HALF_OPEN:
+            if self._probe_inflight:
+                self.rejected += 1
+                return False
+            self._probe_inflight = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = CLOSED
+        self._probe_inflight = False
+
+    def abandon(self) -> None:
+        """Give back an allowed call that ended without an outcome (shed or cancelled)."""
+        if self.state == HALF_OPEN:
+            self._probe_inflight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probe_inflight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'trips': self.trips,
+        }
@@ -0,0 +1,133 @@
+"""Background compaction of long sessions into a rolling summary.
+
+Only the older turns (all but the newest `keep_turns`) can be folded, so only they are
+measured: once the session holds `turn_threshold` turns, or the older turns reach
+`token_threshold` estimated tokens, they are folded into the session's `summary` field
+by the LLM (`summarize` route), off the request path, and then dropped from the
+in-memory history. At least `min_fold_turns` older turns must have built up before a
+compaction runs (the low-water mark), so a few long recent messages do not trigger a
+summarisation on every new turn. The raw turns stay archived in the
+`conversations` table when the write-behind persister is enabled, and the new summary
+is written to `conversations.summary` as well. Prompt size and memory per session
+therefore stay roughly constant however long the conversation runs.
+
+A failed summarisation leaves the turns in place; the next turn appended retries it.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .prompting import estimate_tokens
+from .sessions import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# (turns to fold, previous summary) -> new summary, or None on failure
+Summarize = Callable[[List[Dict[str, Any]], Optional[str]], Awaitable[Optional[str]]]
+
+
+def _history_tokens(turns) -> int:
+    return sum(estimate_tokens(t['text']) for t in turns)
+
+
+class SessionCompactor:
+    def __init__(
+        self,
+        sessions: SessionStore,
+        summarize: Summarize,
+        turn_threshold: int = 40,
+        token_threshold: int = 2000,
+        keep_turns: int = 8,
+        min_fold_turns: int = 4,
+        on_summary: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.sessions = sessions
+        self.summarize = summarize
+        self.turn_threshold = turn_threshold
+        self.token_threshold = token_threshold
+        self.keep_turns = keep_turns
+        self.min_fold_turns = max(1, min_fold_turns)
+        self.on_summary = on_summary
+        self._running: Dict[str, asyncio.Task] = {}
+        self.compactions = 0
+        self.turns_compacted = 0
+        self.failures = 0
+
+    def needs_compaction(self, session: Dict[str, Any]) -> bool:
+        turns = session.get('turns') or ()
+        foldable = len(turns) - self.keep_turns
+        if foldable < self.min_fold_turns:
+            return False
+        if self.turn_threshold and len(turns) >= self.turn_threshold:
+            return True
+        if not self.token_threshold:
+            return False
+        return _history_tokens(turns[:foldable]) >= self.token_threshold
+
+    def maybe_schedule(self, session: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """Start a background compaction for `session` if it passed a threshold (at most one per session)."""
+        session_id = session.get('session_id')
+        if not session_id or session_id in self._running or not self.needs_compaction(session):
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        task = loop.create_task(self.compact(session_id))
+        self._running[session_id] = task
+        task.add_done_callback(lambda _t: self._running.pop(session_id, None))
+        return task
+
+    async def compact(self, session_id: str) -> bool:
+        s = self.sessions.get(session_id)
+        if s is None or not self.needs_compaction(s):
+            return False
+        turns = s['turns']
+        older = [t.to_dict() if hasattr(t, 'to_dict') else dict(t) for t in turns[:len(turns) - self.keep_turns]]
+        if not older:
+            return False
+        try:
+            summary = await self.summarize(older, s.get('summary'))
+        except Exception:
+            summary = None
+            logger.debug('summarisation of session %s failed', session_id, exc_info=True)
+        if not summary:
+            self.failures += 1
+            return False
+
+        # turns may have been appended meanwhile: drop exactly the ones that were summarised
+        cutoff = older[-1]['ts']
+        try:
+            async with self.sessions.edit(session_id) as s:
+                turns = s['turns']
+                if hasattr(turns, 'count_until'):
+                    n = turns.count_until(cutoff)
+                    turns.drop_oldest(n)
+                else:
+                    n = next((i for i, t in enumerate(turns) if t['ts'] > cutoff), len(turns))
+                    del turns[:n]
+                s['summary'] = summary
+        except KeyError:
+            return False  # session expired while summarising
+        self.compactions += 1
+        self.turns_compacted += n
+        if self.on_summary is not None:
+            self.on_summary(session_id, summary)
+        return True
+
+    async def aclose(self) -> None:
+        """Cancel in-flight compactions; their turns simply stay uncompacted."""
+        tasks = list(self._running.values())
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'compactions': self.compactions,
+            'turns_compacted': self.turns_compacted,
+            'failures': self.failures,
+            'in_flight': len(self._running),
+        }
@@ -0,0 +1,329 @@
+"""Content-addressed embedding cache in a memory-mapped float32 file.
+
+Keys are the SHA-256 of the model name and the normalized text (NFC, whitespace
+collapsed), so a portfolio description, question or snippet is embedded once, across
+restarts and across workers. Two append-only files share the base path:
+
+    <path>.vec   header, then float32 vectors back to back
+    <path>.idx   header, then one 44-byte record per vector:
+                 digest (32 bytes), byte offset into .vec (u64), dimension (u32)
+
+Both headers are the magic plus an 8-byte generation id that must match. The index is
+loaded into a dict `digest -> (offset, dim)` and the vector file is mmapped read-only,
+so a hit returns a NumPy view into the page cache: no copy and no syscall.
+
+Processes sharing the files coordinate with `fcntl.lockf` on `<path>.lock`. Appends
+and compaction take it exclusively; reading the index takes it shared. Another
+worker's appends are picked up on the next miss. Lookups made with `blocking=False`
+(the async adapter, on the event loop) never wait for a lock: while another thread or
+worker holds it they skip the refresh, or report every key as a miss. Workers opened
+with `readonly=True` only read (e.g. a cache filled by a batch job).
+
+Once `.vec` grows past `max_bytes` it is compacted. The vectors this process used most
+recently, then the newest ones, are rewritten into fresh files up to
+`compact_ratio * max_bytes`, and the files are renamed over the old ones. Other
+processes see the new inode and reopen.
+
+Requires the optional `numpy` package.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC_VEC = b'PLEMBV\x00\x01'
+MAGIC_IDX = b'PLEMBI\x00\x01'
+HEADER_SIZE = len(MAGIC_VEC) + 8
+_ENTRY = struct.Struct('<32sQI')
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def content_key(text: str, model: Optional[str] = None) -> bytes:
+    h = hashlib.sha256((model or '').encode('utf-8'))
+    h.update(b'\x00')
+    h.update(normalize_text(text).encode('utf-8', 'surrogatepass'))
+    return h.digest()
+
+
+class EmbeddingCache:
+    """Append-only mmapped vector store keyed by `content_key`.
+
+    Args:
+        path: base path; `.vec`, `.idx` and `.lock` are appended to it.
+        max_bytes: size of `.vec` that triggers a compaction.
+        compact_ratio: fraction of `max_bytes` kept by a compaction.
+        readonly: never write (the files may not exist yet; they are picked up later).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 << 20, compact_ratio: float = 0.5, readonly: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compact_ratio = compact_ratio
+        self.readonly = readonly
+        self._vec_path = path + '.vec'
+        self._idx_path = path + '.idx'
+        self._lock = threading.RLock()
+        self._lock_fd: Optional[int] = None
+        self._vec_fd: Optional[int] = None
+        self._idx_fd: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._idx_read = HEADER_SIZE
+        self._used: Dict[bytes, int] = {}
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.compactions = 0
+        with self._lock:
+            with self._flock(exclusive=not readonly):
+                self._open_locked()
+
+    # -- files --
+
+    def _open_lock_file(self) -> None:
+        if self._lock_fd is not None:
+            return
+        try:
+            if self.readonly:
+                self._lock_fd = os.open(self.path + '.lock', os.O_RDONLY)
+            else:
+                self._lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _flock(self, exclusive: bool, blocking: bool = True) -> Iterator[bool]:
+        """Hold the cross-process lock; yields False when `blocking=False` and it is taken."""
+        self._open_lock_file()
+        if self._lock_fd is None:  # read-only and nobody has written yet
+            yield True
+            return
+        op = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.lockf(self._lock_fd, op if blocking else op | fcntl.LOCK_NB)
+        except (BlockingIOError, PermissionError):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    def _create_locked(self, generation: bytes) -> Tuple[str, str]:
+        """Write empty `.vec`/`.idx` temp files for `generation`; the caller renames them."""
+        paths = []
+        for path, magic in ((self._vec_path, MAGIC_VEC), (self._idx_path, MAGIC_IDX)):
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(magic + generation)
+            paths.append(tmp)
+        return paths[0], paths[1]
+
+    def _close_files(self) -> None:
+        for fd in (self._vec_fd, self._idx_fd):
+            if fd is not None:
+                os.close(fd)
+        self._vec_fd = self._idx_fd = None
+        self._mm = None  # views handed out keep the old mapping alive
+        self._index = {}
+        self._idx_read = HEADER_SIZE
+
+    def _open_locked(self) -> None:
+        self._close_files()
+        if not (os.path.exists(self._idx_path) and os.path.exists(self._vec_path)):
+            if self.readonly:
+                return
+            vec_tmp, idx_tmp = self._create_locked(os.urandom(8))
+            os.replace(vec_tmp, self._vec_path)
+            os.replace(idx_tmp, self._idx_path)
+        flags = os.O_RDONLY if self.readonly else os.O_RDWR
+        self._vec_fd = os.open(self._vec_path, flags)
+        self._idx_fd = os.open(self._idx_path, flags)
+        vec_head = os.pread(self._vec_fd, HEADER_SIZE, 0)
+        idx_head = os.pread(self._idx_fd, HEADER_SIZE, 0)
+        if vec_head[:8] != MAGIC_VEC or idx_head[:8] != MAGIC_IDX or vec_head[8:] != idx_head[8:]:
+            self._close_files()
+            raise ValueError(f'{self.path} is not an embedding cache (or its files are mismatched)')
+        self._read_index_locked()
+
+    def _stale(self) -> bool:
+        """True when the files were replaced (compaction elsewhere) or are not open yet."""
+        if self._idx_fd is None:
+            return True
+        try:
+            return os.stat(self._idx_path).st_ino != os.fstat(self._idx_fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _read_index_locked(self) -> None:
+        size = os.fstat(self._idx_fd).st_size
+        n = (size - self._idx_read) // _ENTRY.size
+        if n <= 0:
+            return
+        data = os.pread(self._idx_fd, n * _ENTRY.size, self._idx_read)
+        for digest, offset, dim in _ENTRY.iter_unpack(data):
+            self._index[digest] = (offset, dim)
+        self._idx_read += n * _ENTRY.size
+
+    def _refresh(self, blocking: bool = True) -> None:
+        with self._flock(exclusive=False, blocking=blocking) as locked:
+            if not locked:
+                return
+            if self._stale():
+                self._open_locked()
+            else:
+                self._read_index_locked()
+
+    def _view(self, offset: int, dim: int) -> np.ndarray:
+        end = offset + 4 * dim
+        if self._mm is None or end > len(self._mm):
+            self._mm = mmap.mmap(self._vec_fd, os.fstat(self._vec_fd).st_size, access=mmap.ACCESS_READ)
+        return np.frombuffer(self._mm, dtype='<f4', count=dim, offset=offset)
+
+    # -- lookups --
+
+    def _touch(self, key: bytes) -> None:
+        self._clock += 1
+        self._used[key] = self._clock
+
+    def get(self, text: str, model: Optional[str] = None, blocking: bool = True) -> Optional[np.ndarray]:
+        """Read-only float32 view of the cached vector, or None."""
+        return self.get_many([text], model, blocking)[0]
+
+    def get_many(
+        self, texts: Sequence[str], model: Optional[str] = None, blocking: bool = True
+    ) -> List[Optional[np.ndarray]]:
+        """Cached vectors (None for misses); with `blocking=False` a held lock means misses."""
+        keys = [content_key(t, model) for t in texts]
+        if not self._lock.acquire(blocking=blocking):
+            self.misses += len(keys)  # a write is in progress in another thread
+            return [None] * len(keys)
+        try:
+            if any(k not in self._index for k in keys):
+                self._refresh(blocking)  # at most once per call: other workers may have added them
+            out: List[Optional[np.ndarray]] = []
+            for key in keys:
+                entry = self._index.get(key)
+                if entry is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    self._touch(key)
+                    out.append(self._view(*entry))
+            return out
+        finally:
+            self._lock.release()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # -- writes --
+
+    def put(self, text: str, vector: Sequence[float], model: Optional[str] = None) -> int:
+        return self.put_many([text], [vector], model)
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], model: Optional[str] = None) -> int:
+        """Append the vectors not stored yet; returns how many were written."""
+        if self.readonly:
+            return 0
+        rows: Dict[bytes, np.ndarray] = {}
+        for text, vector in zip(texts, vectors):
+            rows.setdefault(content_key(text, model), np.asarray(vector, dtype='<f4').ravel())
+        with self._lock, self._flock(exclusive=True):
+            if self._stale():
+                self._open_locked()
+            else:
+                self._read_index_locked()
+            new = [(k, v) for k, v in rows.items() if k not in self._index]
+            if not new:
+                return 0
+            # a crash mid-append may leave a partial tail: vectors stay 4-byte aligned and
+            # the index resumes at the last complete record
+            vec_end = -(-os.fstat(self._vec_fd).st_size // 4) * 4
+            idx_end = self._idx_read
+            blobs, records = [], []
+            offset = vec_end
+            for key, v in new:
+                blobs.append(v.tobytes())
+                records.append(_ENTRY.pack(key, offset, v.size))
+                self._index[key] = (offset, v.size)
+                offset += 4 * v.size
+            os.pwrite(self._vec_fd, b''.join(blobs), vec_end)
+            os.pwrite(self._idx_fd, b''.join(records), idx_end)  # only after the vectors are in
+            os.ftruncate(self._idx_fd, idx_end + len(records) * _ENTRY.size)
+            self._idx_read = idx_end + len(records) * _ENTRY.size
+            self.writes += len(new)
+            if offset > self.max_bytes:
+                self._compact_locked()
+            return len(new)
+
+    def compact(self) -> None:
+        if self.readonly:
+            return
+        with self._lock, self._flock(exclusive=True):
+            if self._stale():
+                self._open_locked()
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        entries = list(self._index.items())
+        position = {key: i for i, (key, _) in enumerate(entries)}
+        ranked = sorted(entries, key=lambda e: (self._used.get(e[0], 0), position[e[0]]), reverse=True)
+        budget = int(self.max_bytes * self.compact_ratio) - HEADER_SIZE
+        keep, total = [], 0
+        for key, (offset, dim) in ranked:
+            if total + 4 * dim <= budget:
+                keep.append((key, offset, dim))
+                total += 4 * dim
+        keep.sort(key=lambda e: position[e[0]])
+        vec_tmp, idx_tmp = self._create_locked(os.urandom(8))
+        with open(vec_tmp, 'ab') as vf, open(idx_tmp, 'ab') as xf:
+            offset = HEADER_SIZE
+            for key, old_offset, dim in keep:
+                vf.write(self._view(old_offset, dim).tobytes())
+                xf.write(_ENTRY.pack(key, offset, dim))
+                offset += 4 * dim
+        os.replace(vec_tmp, self._vec_path)
+        os.replace(idx_tmp, self._idx_path)
+        kept = {key for key, _, _ in keep}
+        self._used = {k: t for k, t in self._used.items() if k in kept}
+        self._open_locked()
+        self.compactions += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, read without the lock (served on the event loop; may lag a write)."""
+        fd = self._vec_fd
+        try:
+            size = os.fstat(fd).st_size if fd is not None else 0
+        except OSError:  # closed by a concurrent reopen
+            size = 0
+        return {
+            'path': self.path,
+            'entries': len(self._index),
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'compactions': self.compactions,
+            'readonly': self.readonly,
+        }
@@ -0,0 +1,196 @@
+"""Fast local (regex + gazetteer) slot extractor for discovery messages.
+
+Runs before the LLM on every discovery message: slots recognised with enough
+confidence are filled locally and the LLM is only asked for the rest. It is also the
+whole extractor while the LLM circuit is open. Patterns are compiled once at import
+time; confidences are fixed per pattern, reflecting how unambiguous each form is.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+_NUM = r'\d{1,3}(?:[.\s]\d{3})+|\d+(?:[.,]\d+)?'
+_MULT = r'mil|k|mi|milh(?:ao|oes)'
+
+# budget forms, from most to least explicit:
+#   cur:  currency sign/code before the number ("R$ 50.000", "US$ 10k")
+#   cur2: currency word after it ("20 mil reais")
+#   kw:   money keyword shortly before it, in the same sentence ("orcamento de 20 mil")
+#   bare: a number with a multiplier and nothing else ("uns 30k")
+# `unit` captures the word after the number so counts ("5 mil usuarios") can be rejected
+_BUDGET_RE = re.compile(
+    rf'(?P<cur>r\$|us\$|\$|€|\b(?:usd|brl|eur)\b)\s*(?P<num>{_NUM})(?:\s*(?P<mult>{_MULT})\b)?'
+    rf'|\b(?P<num2>{_NUM})(?:\s*(?P<mult2>{_MULT})\b)?\s*(?:de\s+)?(?P<cur2>reais|dolares|euros?|usd|brl)\b'
+    rf'|\b(?P<kw>orcamento|budget|verba|investimento)[^\d.!?;$]{{0,20}}?(?P<cur3>r\$|us\$|\$)?\s*(?P<num3>{_NUM})'
+    rf'(?:\s*(?P<mult3>{_MULT})\b)?(?P<unit3>\s+[a-z]+)?'
+    rf'|\b(?P<num4>{_NUM})\s*(?P<mult4>{_MULT})\b(?P<unit4>\s+[a-z]+)?'
+)
+
+# nouns that make a number a count, not money
+_COUNT_NOUNS = frozenset((
+    'pessoa', 'pessoas', 'usuario', 'usuarios', 'cliente', 'clientes', 'acesso', 'acessos',
+    'visita', 'visitas', 'download', 'downloads', 'pedido', 'pedidos', 'aluno', 'alunos',
+    'funcionario', 'funcionarios', 'colaborador', 'colaboradores', 'membro', 'membros',
+    'lead', 'leads', 'loja', 'lojas', 'produto', 'produtos', 'item', 'itens', 'unidade',
+    'unidades', 'mensagem', 'mensagens', 'hora', 'horas', 'dia', 'dias', 'semana',
+    'semanas', 'mes', 'meses', 'ano', 'anos', 'vendedor', 'vendedores', 'seguidor', 'seguidores',
+))
+
+_MULTIPLIERS = {'mil': 1_000, 'k': 1_000, 'mi': 1_000_000, 'milhao': 1_000_000, 'milhoes': 1_000_000}
+
+# normalised term -> canonical KPI label
+KPI_GAZETTEER = {
+    'retencao': 'retenção',
+    'churn': 'retenção',
+    'conversao': 'conversão',
+    'engajamento': 'engajamento',
+    'receita': 'receita',
+    'faturamento': 'receita',
+    'nps': 'NPS',
+    'ticket medio': 'ticket médio',
+    'cac': 'CAC',
+    'ltv': 'LTV',
+    'tempo de resposta': 'tempo de resposta',
+    'usuarios ativos': 'usuários ativos',
+}
+
+_KPI_RE = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, KPI_GAZETTEER), key=len, reverse=True)) + r')\b')
+
+_USERS_RE = re.compile(
+    r'\b(?P<noun>usuarios?|clientes?|publico(?:[- ]alvo)?|consumidores?|pacientes?|alunos?|vendedores?|lojistas?)'
+    r'(?P<link>\s*:|\s+(?:sao|serao|seriam))?'
+    r'\s+(?P<desc>[a-z0-9][\w\s\-/]{2,60}?)(?=[.,;!?]|$|\s+(?:que|com|para|e\s+o|e\s+a)\b)'
+)
+
+
+_PAIN_RE = re.compile(
+    r'\b(?:(?:o\s+)?(?:principal\s+)?(?:problema|dor|desafio)(?:\s+principal)?\s+(?:e|eh|sao)\s*:?'
+    r'|(?:precisamos|preciso|queremos|quero)\s+(?=(?:reduzir|diminuir|resolver|acabar|eliminar|evitar)\b))'
+    r'\s*(?P<desc>[^.;!?]{4,160})'
+)
+
+# pattern confidences: currency budgets are near certain and a money keyword with a
+# money-shaped amount is close; a bare number after the keyword or a lone multiplier
+# ("30k") stays below the threshold so the LLM decides. Free-form users/pain phrases
+# are only good enough to skip the LLM when explicit.
+CONFIDENCE = {
+    'budget_currency': 0.95,
+    'budget_keyword': 0.9,
+    'budget_keyword_bare': 0.6,
+    'budget_multiplier': 0.5,
+    'kpi_exact': 0.9,
+    'kpi_synonym': 0.8,
+    'users_explicit': 0.8,
+    'users_mention': 0.6,
+    'pain_explicit': 0.8,
+    'pain_intent': 0.5,
+}
+
+# gazetteer keys that map onto a different canonical KPI
+_KPI_SYNONYMS = {'churn', 'faturamento'}
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so patterns stay simple."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _to_number(raw: str, mult: Optional[str]) -> str:
+    raw = raw.replace(' ', '')
+    if re.fullmatch(r'\d{1,3}(?:\.\d{3})+', raw):
+        value = float(raw.replace('.', ''))
+    else:
+        value = float(raw.replace('.', '').replace(',', '.')) if ',' in raw else float(raw)
+    if mult:
+        value *= _MULTIPLIERS.get(mult, 1)
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def _budget_candidate(m: 're.Match[str]') -> Optional[Tuple[str, float]]:
+    if m.group('cur'):
+        return _to_number(m.group('num'), m.group('mult')), CONFIDENCE['budget_currency']
+    if m.group('cur2'):
+        return _to_number(m.group('num2'), m.group('mult2')), CONFIDENCE['budget_currency']
+    if m.group('cur3'):
+        return _to_number(m.group('num3'), m.group('mult3')), CONFIDENCE['budget_currency']
+    num, mult, unit = m.group('num3'), m.group('mult3'), m.group('unit3')
+    kind = 'budget_keyword'
+    if num is None:
+        num, mult, unit = m.group('num4'), m.group('mult4'), m.group('unit4')
+        kind = 'budget_multiplier'
+    if unit and unit.strip() in _COUNT_NOUNS:
+        return None
+    if not mult:
+        if re.fullmatch(r'(?:19|20)\d{2}', num):
+            return None  # a year, not an amount
+        if not re.fullmatch(r'\d{1,3}(?:[.\s]\d{3})+', num):
+            kind = 'budget_keyword_bare'
+    return _to_number(num, mult), CONFIDENCE[kind]
+
+
+def _best_budget(norm: str) -> Optional[Tuple[str, float]]:
+    best: Optional[Tuple[str, float]] = None
+    for m in _BUDGET_RE.finditer(norm):
+        cand = _budget_candidate(m)
+        if cand is not None and (best is None or cand[1] > best[1]):
+            best = cand
+    return best
+
+
+def extract_budget(norm: str) -> Optional[str]:
+    best = _best_budget(norm)
+    return best[0] if best else None
+
+
+def extract_kpi(norm: str) -> Optional[str]:
+    m = _KPI_RE.search(norm)
+    return KPI_GAZETTEER[m.group(1)] if m else None
+
+
+def extract_users(norm: str, original: Optional[str] = None) -> Optional[str]:
+    m = _USERS_RE.search(norm)
+    if not m:
+        return None
+    # report the user's own spelling when normalisation kept character offsets intact
+    src = original if original is not None and len(original) == len(norm) else norm
+    noun = src[m.start('noun'):m.end('noun')]
+    desc = src[m.start('desc'):m.end('desc')].strip()
+    return f'{noun} {desc}'
+
+
+def extract_pain(norm: str, original: Optional[str] = None) -> Optional[str]:
+    m = _PAIN_RE.search(norm)
+    if not m:
+        return None
+    src = original if original is not None and len(original) == len(norm) else norm
+    return src[m.start('desc'):m.end('desc')].strip()
+
+
+def extract(message: str) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """Return (slots, confidence) for everything recognised locally."""
+    norm = normalize(message)
+    slots: Dict[str, str] = {}
+    conf: Dict[str, float] = {}
+    budget = _best_budget(norm)
+    if budget:
+        slots['budget'], conf['budget'] = budget
+    m = _KPI_RE.search(norm)
+    if m:
+        slots['kpi'] = KPI_GAZETTEER[m.group(1)]
+        conf['kpi'] = CONFIDENCE['kpi_synonym' if m.group(1) in _KPI_SYNONYMS else 'kpi_exact']
+    m = _USERS_RE.search(norm)
+    if m:
+        slots['users'] = extract_users(norm, message)
+        conf['users'] = CONFIDENCE['users_explicit' if m.group('link') else 'users_mention']
+    m = _PAIN_RE.search(norm)
+    if m:
+        slots['pain'] = extract_pain(norm, message)
+        conf['pain'] = CONFIDENCE['pain_intent' if m.group(0).startswith(('precis', 'quer')) else 'pain_explicit']
+    return slots, conf
+
+
+def extract_slots(message: str) -> Dict[str, str]:
+    """Return the slots that could be recognised locally, regardless of confidence."""
+    return extract(message)[0]
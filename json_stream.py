@@ -0,0 +1,170 @@
+"""Incremental, tolerant JSON parsing of streamed LLM output.
+
+`IncrementalJSONParser` is fed text chunks as tokens arrive and reports each member
+of the top-level container the moment it is complete: `(key, value)` pairs for an
+object, `(None, element)` for an array. Anything before the first `{` / `[` (prose,
+"```json" fences) and after the matching close (trailing prose, closing fence) is
+ignored, so extraction does not need a second round trip when the model decorates
+its answer. Members whose value is not valid JSON are skipped rather than failing
+the whole parse.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+_WS = ' \t\r\n'
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self._buf = ''
+        self._pos = 0
+        self._kind: Optional[str] = None  # '{' or '[' once the container starts
+        self.done = False
+        self.result: Any = None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Any]]:
+        if self.done:
+            return []
+        self._buf += chunk
+        events: List[Tuple[Optional[str], Any]] = []
+        if self._kind is None:
+            starts = [i for i in (self._buf.find('{', self._pos), self._buf.find('[', self._pos)) if i >= 0]
+            if not starts:
+                self._pos = len(self._buf)
+                return events
+            self._pos = min(starts)
+            self._kind = self._buf[self._pos]
+            self.result = {} if self._kind == '{' else []
+            self._pos += 1
+        while not self.done:
+            ev = self._next_member()
+            if ev is None:
+                break
+            if ev is not _SKIP:
+                events.append(ev)
+        # drop what was consumed so the buffer stays small on long streams
+        if self._pos > 4096:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        return events
+
+    def close(self) -> List[Tuple[Optional[str], Any]]:
+        """End of stream: complete a trailing scalar if its closing delimiter never came."""
+        if self.done or self._kind is None:
+            return []
+        return self.feed('}' if self._kind == '{' else ']')
+
+    def _skip(self, chars: str, i: int) -> int:
+        buf = self._buf
+        while i < len(buf) and buf[i] in chars:
+            i += 1
+        return i
+
+    def _next_member(self):
+        """Parse one member; `self._pos` only advances once the member is complete."""
+        buf = self._buf
+        i = self._skip(_WS + ',', self._pos)
+        if i >= len(buf):
+            return None
+        close = '}' if self._kind == '{' else ']'
+        if buf[i] == close:
+            self._pos = i + 1
+            self.done = True
+            return None
+        key = None
+        if self._kind == '{':
+            if buf[i] != '"':
+                # tolerate junk (e.g. a comment) by skipping to the next member
+                end = self._scan_scalar(i)
+                if end is None:
+                    return None
+                self._pos = max(end, i + 1)
+                return _SKIP
+            end = _scan_string(buf, i)
+            if end is None:
+                return None
+            key = json.loads(buf[i:end])
+            j = self._skip(_WS, end)
+            if j >= len(buf):
+                return None
+            if buf[j] != ':':
+                self._pos = j
+                return _SKIP
+            i = self._skip(_WS, j + 1)
+            if i >= len(buf):
+                return None
+        end = self._scan_value(i)
+        if end is None:
+            return None
+        if end == i:
+            # a stray closer where a value should start (e.g. `[{...}}, ...]`): step over it,
+            # except the object's own `}` after a missing value, which ends the object next
+            self._pos = i if buf[i] == close else i + 1
+            return _SKIP
+        raw = buf[i:end]
+        self._pos = end
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return _SKIP
+        if self._kind == '{':
+            self.result[key] = value
+        else:
+            self.result.append(value)
+        return (key, value)
+
+    def _scan_value(self, i: int) -> Optional[int]:
+        c = self._buf[i]
+        if c == '"':
+            return _scan_string(self._buf, i)
+        if c in '{[':
+            return _scan_container(self._buf, i)
+        return self._scan_scalar(i)
+
+    def _scan_scalar(self, i: int) -> Optional[int]:
+        """Numbers/literals end at a delimiter; at buffer end they may still be growing."""
+        buf = self._buf
+        j = i
+        while j < len(buf) and buf[j] not in ',}]' + _WS:
+            j += 1
+        return j if j < len(buf) else None
+
+
+_SKIP = object()
+
+
+def _scan_string(buf: str, i: int) -> Optional[int]:
+    j = i + 1
+    n = len(buf)
+    while j < n:
+        c = buf[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '"':
+            return j + 1
+        j += 1
+    return None
+
+
+def _scan_container(buf: str, i: int) -> Optional[int]:
+    depth = 0
+    j = i
+    n = len(buf)
+    while j < n:
+        c = buf[j]
+        if c == '"':
+            end = _scan_string(buf, j)
+            if end is None:
+                return None
+            j = end
+            continue
+        if c in '{[':
+            depth += 1
+        elif c in '}]':
+            depth -= 1
+            if depth == 0:
+                return j + 1
+        j += 1
+    return None
@@ -0,0 +1,89 @@
+"""Rolling latency statistics and the hedge budget used by PolarisAgent.call_llm.
+
+`LatencyTracker` keeps the last `window` samples for one upstream in a sorted list so
+percentile reads are O(1) and inserts are O(window). Samples older than `max_age`
+seconds are dropped as well, so a latency step change (either way) is fully reflected
+within `max_age` even when traffic is light. `HedgeBudget` is a token bucket:
+every primary request earns `ratio` tokens and every hedge spends one, so hedges can
+never add more than `ratio` extra load on average.
+"""
+
+import bisect
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 512, max_age: Optional[float] = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.max_age = max_age
+        self.clock = clock
+        self._samples: Deque[Tuple[float, float]] = deque()  # (recorded at, seconds)
+        self._sorted: List[float] = []
+        self.count = 0
+
+    def _pop_oldest(self) -> None:
+        _, old = self._samples.popleft()
+        del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    def _expire(self) -> None:
+        if self.max_age is None:
+            return
+        cutoff = self.clock() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._pop_oldest()
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self._samples.append((self.clock(), seconds))
+        bisect.insort(self._sorted, seconds)
+        if len(self._samples) > self.window:
+            self._pop_oldest()
+        self._expire()
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._sorted)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile (q in 0..100), or None without samples."""
+        self._expire()
+        if not self._sorted:
+            return None
+        idx = min(len(self._sorted) - 1, max(0, int(round(q / 100.0 * len(self._sorted))) - 1))
+        return self._sorted[idx]
+
+    def stats(self) -> Dict[str, Any]:
+        def ms(v: Optional[float]) -> Optional[float]:
+            return None if v is None else round(v * 1000, 2)
+        return {
+            'count': self.count,
+            'p50_ms': ms(self.percentile(50)),
+            'p95_ms': ms(self.percentile(95)),
+            'p99_ms': ms(self.percentile(99)),
+        }
+
+
+class HedgeBudget:
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.sent = 0
+        self.won = 0
+        self.denied = 0
+
+    def earn(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.sent += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {'sent': self.sent, 'won': self.won, 'denied': self.denied, 'tokens': round(self.tokens, 2)}
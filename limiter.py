@@ -0,0 +1,144 @@
+"""Adaptive concurrency limiter with a bounded wait queue (load shedding).
+
+The limit follows AIMD driven by observed latency: each successful call that finishes
+close to the long-term latency average grows the limit by 1/limit (about +1 per round
+trip of the whole window); an error or a call slower than `tolerance` times the
+average shrinks it multiplicatively. Callers beyond the limit wait in a bounded FIFO;
+when that queue is full, or a caller waited longer than `queue_timeout`, the call is
+shed with `LLMOverloaded` so the API can answer 503 right away.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+
+class LLMOverloaded(Exception):
+    """Raised when the LLM backend is saturated and the request was shed."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__(f'llm overloaded, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 200,
+        max_queue: int = 100,
+        queue_timeout: float = 2.0,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.shed = 0
+        self.latency_ewma = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise LLMOverloaded(self.retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise LLMOverloaded(self.retry_after())
+        except asyncio.CancelledError:
+            # the slot may have been handed over just before the cancellation landed
+            if fut.done() and not fut.cancelled():
+                self.inflight -= 1
+                self._wake()
+            raise
+        finally:
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+
+    def release(self, latency: Optional[float], ok: Optional[bool] = True) -> None:
+        """Return a slot; `ok=None` (e.g. a cancelled call) leaves the limit unchanged.
+
+        `latency=None` reports a success without a latency sample (a stream, whose
+        duration depends on the output length): it can grow the limit but never
+        shrinks it and does not move the latency average.
+        """
+        self.inflight -= 1
+        if ok is None:
+            self._wake()
+            return
+        if latency is None:
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._wake()
+            return
+        if ok and self.latency_ewma == 0.0:
+            self.latency_ewma = latency
+        if not ok or latency > self.tolerance * self.latency_ewma:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        if ok:
+            self.latency_ewma += 0.05 * (latency - self.latency_ewma)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.inflight += 1
+            fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Dict[str, Any]]:
+        """Hold one concurrency slot; set `outcome['ok'] = False` to report a failure.
+
+        Setting `outcome['latency']` overrides the measured hold time (None: no sample).
+        """
+        await self.acquire()
+        outcome: Dict[str, Any] = {'ok': True}
+        start = time.monotonic()
+        try:
+            yield outcome
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome['ok'] = None
+            raise
+        except BaseException:
+            outcome['ok'] = False
+            raise
+        finally:
+            latency = outcome['latency'] if 'latency' in outcome else time.monotonic() - start
+            self.release(latency, outcome['ok'])
+
+    def retry_after(self) -> int:
+        per_call = self.latency_ewma or 1.0
+        return max(1, math.ceil(len(self._waiters) * per_call / max(self.limit, 1.0)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': int(self.limit),
+            'inflight': self.inflight,
+            'queue_depth': len(self._waiters),
+            'shed': self.shed,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 2),
+        }
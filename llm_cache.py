@@ -0,0 +1,230 @@
+"""Response cache for deterministic LLM calls.
+
+Two tiers: a bounded in-memory LRU with TTL in front of an optional SQLite file that
+survives restarts. Keys are derived from everything that influences the completion
+(prompt, max_tokens, temperature, model), so only identical requests share an entry.
+Disk writes are buffered and written off the event loop once the cache is started,
+and the disk tier is purged and size-capped as it grows.
+"""
+
+import asyncio
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(prompt: str, max_tokens: int, temperature: float, model: Optional[str] = None) -> str:
+    raw = json.dumps([prompt, int(max_tokens), float(temperature), model or ''], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL memory tier with an optional on-disk SQLite tier.
+
+    Disk writes are write-behind once `start()` has run (app lifespan): `set` only
+    buffers the entry and a background task writes the buffer in a worker thread every
+    `flush_interval` seconds, on its own connection. Without `start()` (scripts, tests)
+    they are written inline. Every `purge_every` disk writes, expired rows are deleted
+    and the table is trimmed to the `max_disk_entries` newest rows.
+
+    Args:
+        max_entries: maximum number of entries kept in memory (LRU eviction).
+        ttl: seconds an entry stays valid in both tiers.
+        path: SQLite file for the persistent tier; None keeps the cache memory-only.
+        max_disk_entries: upper bound on rows kept in the SQLite tier.
+        flush_interval: seconds between background flushes of buffered disk writes.
+        purge_every: disk writes between two purges of the SQLite tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+        flush_interval: float = 1.0,
+        purge_every: int = 1000,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.flush_interval = flush_interval
+        self.purge_every = max(1, purge_every)
+        self._mem: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._since_purge = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_writes = 0
+        self.purged = 0
+        if path:
+            self._db = self._connect()
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._writer = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._mem[key]
+            if self._db is not None:
+                row = self._pending.get(key) or self._db.execute(
+                    'SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is None:
+                return
+            self._pending[key] = (json.dumps(value, ensure_ascii=False), expires_at)
+        if self._task is None:
+            self.flush()
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def flush(self) -> int:
+        """Write the buffered entries to disk now (blocking); returns how many were written."""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch or self._writer is None:
+                return 0
+            rows = [(k, v, exp) for k, (v, exp) in batch.items()]
+            try:
+                self._writer.execute('BEGIN IMMEDIATE')
+                try:
+                    self._writer.executemany(
+                        'INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)', rows
+                    )
+                except BaseException:
+                    self._writer.execute('ROLLBACK')
+                    raise
+                self._writer.execute('COMMIT')
+            except Exception:
+                with self._lock:
+                    self._pending = {**batch, **self._pending}  # retried on the next flush
+                raise
+            self.disk_writes += len(rows)
+            self._since_purge += len(rows)
+            if self._since_purge >= self.purge_every:
+                self._purge_disk()
+            return len(rows)
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers and trim the disk tier; returns disk rows removed."""
+        now = time.time()
+        with self._lock:
+            for k in [k for k, (exp, _) in self._mem.items() if exp <= now]:
+                del self._mem[k]
+        if self._writer is None:
+            return 0
+        with self._write_lock:
+            return self._purge_disk()
+
+    def _purge_disk(self) -> int:
+        """Caller holds `_write_lock`."""
+        self._since_purge = 0
+        removed = self._writer.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+        # one TTL for every entry: the earliest expiry is the oldest write
+        removed += self._writer.execute(
+            'DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY expires_at '
+            'LIMIT max(0, (SELECT count(*) FROM llm_cache) - ?))',
+            (self.max_disk_entries,),
+        ).rowcount
+        self.purged += removed
+        return removed
+
+    # -- lifecycle --
+
+    async def start(self) -> None:
+        """Switch disk writes to the background writer (no-op for a memory-only cache)."""
+        if self._writer is None or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # shielded: cancelling the loop must not abandon a write already in the thread
+                await asyncio.shield(asyncio.to_thread(self.flush))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('llm cache flush failed; will retry', exc_info=True)
+
+    async def aclose(self) -> None:
+        """Stop the background writer and write what is still buffered."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'evictions': self.evictions,
+            'size': len(self._mem),
+            'persistent': self._db is not None,
+            'pending': len(self._pending),
+            'disk_writes': self.disk_writes,
+            'purged': self.purged,
+        }
+
+    def close(self) -> None:
+        self.flush()
+        with self._write_lock, self._lock:
+            for conn in (self._db, self._writer):
+                if conn is not None:
+                    conn.close()
+            self._db = self._writer = None
@@ -0,0 +1,292 @@
+"""Write-behind persistence of conversations (`conversations` table, see SQL_SCHEMA.md).
+
+Turn appends are buffered in memory per session and flushed in batches, with one
+`executemany` upsert per flush. A flush runs when `max_batch` turns are pending or
+every `flush_interval` seconds, whichever comes first, and a final flush drains the
+buffer on shutdown. The database work runs in a worker thread, so a request never
+waits on it. Each flush appends the new turns to the stored `transcript` array.
+
+Dialects: `sqlite` (stdlib `sqlite3`, also the local stand-in used by the tests) and
+`postgres` (optional `psycopg` package, `jsonb` concatenation).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS conversations ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT UNIQUE, client_id TEXT, '
+    "transcript TEXT NOT NULL DEFAULT '[]', summary TEXT, metadata TEXT NOT NULL DEFAULT '{}', "
+    'created_at REAL)'
+)
+
+# transcripts are JSON arrays: appending is splicing the new array into the old one
+UPSERT_SQL = {
+    'sqlite': (
+        'INSERT INTO conversations (session_id, client_id, transcript, summary, metadata, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (session_id) DO UPDATE SET '
+        'transcript = CASE '
+        "WHEN excluded.transcript = '[]' THEN conversations.transcript "
+        "WHEN conversations.transcript = '[]' THEN excluded.transcript "
+        "ELSE substr(conversations.transcript, 1, length(conversations.transcript) - 1) || ', ' "
+        '|| substr(excluded.transcript, 2) END, '
+        'summary = COALESCE(excluded.summary, conversations.summary), '
+        'client_id = COALESCE(conversations.client_id, excluded.client_id)'
+    ),
+    'postgres': (
+        'INSERT INTO conversations (session_id, client_id, transcript, summary, metadata, created_at) '
+        'VALUES (%s, %s, %s::jsonb, %s, %s::jsonb, to_timestamp(%s)) '
+        'ON CONFLICT (session_id) DO UPDATE SET '
+        'transcript = COALESCE(conversations.transcript, \'[]\'::jsonb) || excluded.transcript, '
+        'summary = COALESCE(excluded.summary, conversations.summary), '
+        'client_id = COALESCE(conversations.client_id, excluded.client_id)'
+    ),
+}
+
+
+class _Pending:
+    __slots__ = ('client_id', 'metadata', 'created_at', 'turns', 'summary')
+
+    def __init__(self, client_id: Optional[str], metadata: Optional[Dict[str, Any]], created_at: Optional[float]):
+        self.client_id = client_id
+        self.metadata = metadata
+        self.created_at = created_at
+        self.turns: List[Dict[str, Any]] = []
+        self.summary: Optional[str] = None
+
+
+class ConversationPersister:
+    """Buffers turn appends and flushes them to the `conversations` table in batches.
+
+    Args:
+        connect: zero-argument factory returning a DB-API connection (called once,
+            from the flush thread).
+        dialect: 'sqlite' or 'postgres' (selects the upsert statement).
+        max_batch: pending turns that trigger an immediate flush.
+        flush_interval: seconds between time-triggered flushes.
+        max_pending: upper bound on buffered turns while the database is unreachable;
+            beyond it the oldest sessions' pending turns are dropped (and counted).
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        dialect: str = 'sqlite',
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 100_000,
+    ):
+        if dialect not in UPSERT_SQL:
+            raise ValueError(f'unknown dialect: {dialect}')
+        self.connect = connect
+        self.dialect = dialect
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._conn: Any = None
+        self._pending: Dict[str, _Pending] = {}
+        self._pending_turns = 0
+        self._buffer_lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.turns_written = 0
+        self.failures = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['ConversationPersister']:
+        """`CONVERSATIONS_DB` = sqlite:///path/to.db or postgresql://...; unset disables it."""
+        url = os.getenv('CONVERSATIONS_DB')
+        if not url:
+            return None
+        kwargs = {
+            'max_batch': int(os.getenv('CONVERSATIONS_FLUSH_BATCH', '500')),
+            'flush_interval': float(os.getenv('CONVERSATIONS_FLUSH_INTERVAL', '1.0')),
+        }
+        if url.startswith('sqlite:///'):
+            return cls.sqlite(url[len('sqlite:///'):], **kwargs)
+        if url.startswith(('postgres://', 'postgresql://')):
+            import psycopg
+
+            return cls(lambda: psycopg.connect(url, autocommit=True), dialect='postgres', **kwargs)
+        raise ValueError(f'unsupported CONVERSATIONS_DB: {url}')
+
+    @classmethod
+    def sqlite(cls, path: str, **kwargs) -> 'ConversationPersister':
+        def connect() -> sqlite3.Connection:
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SQLITE_SCHEMA)
+            return conn
+
+        return cls(connect, dialect='sqlite', **kwargs)
+
+    # -- producers (called from request handlers; never block on the database) --
+
+    def record_turn(
+        self,
+        session_id: str,
+        turn: Dict[str, Any],
+        client_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        created_at: Optional[float] = None,
+    ) -> None:
+        with self._buffer_lock:
+            p = self._pending.get(session_id)
+            if p is None:
+                p = self._pending[session_id] = _Pending(client_id, metadata, created_at)
+            p.turns.append(turn)
+            self._pending_turns += 1
+            if self._pending_turns > self.max_pending:
+                self._shed()
+            full = self._pending_turns >= self.max_batch
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def record_summary(self, session_id: str, summary: str) -> None:
+        with self._buffer_lock:
+            p = self._pending.get(session_id)
+            if p is None:
+                p = self._pending[session_id] = _Pending(None, None, None)
+            p.summary = summary
+
+    def _shed(self) -> None:
+        while self._pending_turns > self.max_pending and self._pending:
+            sid = next(iter(self._pending))
+            p = self._pending.pop(sid)
+            self._pending_turns -= len(p.turns)
+            self.dropped += len(p.turns)
+        logger.warning('conversation buffer full; dropped %d pending turns so far', self.dropped)
+
+    # -- lifecycle --
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # shielded: cancelling the loop must not abandon a write already in the thread
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('conversation flush failed; will retry', exc_info=True)
+
+    async def aclose(self) -> None:
+        """Stop the background flusher and drain everything still buffered."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        finally:
+            if self._conn is not None:
+                conn, self._conn = self._conn, None
+                await asyncio.to_thread(conn.close)
+
+    async def flush(self) -> int:
+        """Write all pending changes now; returns the number of rows upserted."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            with self._buffer_lock:
+                batch, self._pending = self._pending, {}
+                turns, self._pending_turns = self._pending_turns, 0
+            if not batch:
+                return 0
+            rows = self._rows(batch)
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception:
+                self.failures += 1
+                self._requeue(batch)
+                raise
+            self.flushes += 1
+            self.rows_written += len(rows)
+            self.turns_written += turns
+            return len(rows)
+
+    def _rows(self, batch: Dict[str, _Pending]) -> List[Tuple[Any, ...]]:
+        return [
+            (
+                sid,
+                p.client_id,
+                json.dumps(p.turns, ensure_ascii=False),
+                p.summary,
+                json.dumps(p.metadata or {}, ensure_ascii=False),
+                p.created_at if p.created_at is not None else time.time(),
+            )
+            for sid, p in batch.items()
+        ]
+
+    def _write(self, rows: List[Tuple[Any, ...]]) -> None:
+        if self._conn is None:
+            self._conn = self.connect()
+        cur = self._conn.cursor()
+        try:
+            if self.dialect == 'sqlite':
+                cur.execute('BEGIN IMMEDIATE')
+                try:
+                    cur.executemany(UPSERT_SQL['sqlite'], rows)
+                except BaseException:
+                    cur.execute('ROLLBACK')
+                    raise
+                cur.execute('COMMIT')
+            else:
+                with self._conn.transaction():
+                    cur.executemany(UPSERT_SQL[self.dialect], rows)
+        finally:
+            cur.close()
+
+    def _requeue(self, batch: Dict[str, _Pending]) -> None:
+        """Put a failed batch back in front of anything buffered since, keeping turn order."""
+        with self._buffer_lock:
+            newer = self._pending
+            for sid, p in newer.items():
+                old = batch.get(sid)
+                if old is None:
+                    batch[sid] = p
+                else:
+                    old.turns.extend(p.turns)
+                    old.summary = p.summary or old.summary
+            self._pending = batch
+            self._pending_turns = sum(len(p.turns) for p in batch.values())
+            if self._pending_turns > self.max_pending:
+                self._shed()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending_sessions': len(self._pending),
+            'pending_turns': self._pending_turns,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'turns_written': self.turns_written,
+            'failures': self.failures,
+            'dropped': self.dropped,
+        }
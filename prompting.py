@@ -0,0 +1,144 @@
+"""Token-budgeted prompt construction.
+
+Prompts are assembled from parts in priority order: the fixed instruction, the current
+user message, the rolling session summary, then as many of the most recent turns as
+still fit. When the message alone exceeds its share it is windowed (head + tail kept),
+so one oversized paste cannot blow up latency or get the call rejected upstream.
+
+Token counts come from a pluggable estimator. The default is a fast character/word
+heuristic with an LRU cache; `set_estimator` swaps in an exact tokenizer (e.g. tiktoken).
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ELLIPSIS = ' […] '
+
+ROLE_LABELS = {'client': 'User', 'assistant': 'Assistant'}
+
+
+def heuristic_tokens(text: str) -> int:
+    """~4 characters per token, never fewer tokens than whitespace-separated words."""
+    return max(len(text.split()), (len(text) + 3) // 4)
+
+
+_estimator: Callable[[str], int] = heuristic_tokens
+
+
+@lru_cache(maxsize=8192)
+def _cached_estimate(text: str) -> int:
+    return _estimator(text)
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return _cached_estimate(text)
+
+
+def set_estimator(fn: Callable[[str], int]) -> None:
+    """Replace the token estimator (clears the estimate cache)."""
+    global _estimator
+    _estimator = fn
+    _cached_estimate.cache_clear()
+
+
+def tiktoken_estimator(encoding: str = 'cl100k_base') -> Callable[[str], int]:
+    """Exact counts via the optional `tiktoken` package."""
+    import tiktoken
+
+    enc = tiktoken.get_encoding(encoding)
+    return lambda text: len(enc.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Window `text` to about `max_tokens`, keeping the head and the tail."""
+    if max_tokens <= 0:
+        return ''
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    keep = max(1, int(len(text) * max_tokens / total) - len(ELLIPSIS))
+    while keep > 1:
+        head = (keep * 2) // 3
+        out = text[:head].rstrip() + ELLIPSIS + text[len(text) - (keep - head):].lstrip()
+        if estimate_tokens(out) <= max_tokens:
+            return out
+        keep = int(keep * 0.9)
+    return text[:max(1, max_tokens)]
+
+
+class PromptBuilder:
+    def __init__(self, budget: int, message_share: float = 0.6):
+        self.budget = budget
+        self.message_share = message_share
+
+    def build(
+        self,
+        instruction: str,
+        message: str,
+        history: Optional[Iterable[Dict[str, Any]]] = None,
+        summary: Optional[str] = None,
+    ) -> str:
+        remaining = self.budget - estimate_tokens(instruction) - 8
+        msg = truncate_to_tokens(message, max(16, int(remaining * self.message_share)))
+        remaining -= estimate_tokens(msg)
+
+        sections: List[str] = []
+        if summary and remaining > 0:
+            summary = truncate_to_tokens(summary, remaining // 2)
+            remaining -= estimate_tokens(summary)
+            sections.append(f'Conversation summary:\n{summary}')
+
+        lines: List[str] = []
+        for turn in reversed(list(history or [])):
+            line = f"{ROLE_LABELS.get(turn.get('from'), 'User')}: {turn.get('text') or ''}"
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+        if lines:
+            sections.append('Conversation so far:\n' + '\n'.join(reversed(lines)))
+
+        if not sections:
+            return f'{instruction} Message: "{msg}"'
+        sections.append(f'Message: "{msg}"')
+        return instruction + '\n\n' + '\n\n'.join(sections)
+
+    def fit_message(self, message: str, parts: int = 1) -> str:
+        """Window a message to its share of the budget when `parts` messages share one prompt."""
+        return truncate_to_tokens(message, max(16, int(self.budget * self.message_share) // max(1, parts)))
+
+
+CHAT_INSTRUCTION = 'You are a helpful assistant. Reply in a concise, friendly and human tone to the user message.'
+
+SUMMARY_INSTRUCTION = (
+    'Update the running summary of this discovery conversation with the new turns below. '
+    'Keep every fact about the client\'s pain, target users, success metric and budget, '
+    'plus decisions and open questions. Reply with the updated summary only, in at most 150 words.'
+)
+
+chat_prompts = PromptBuilder(int(os.getenv('PROMPT_BUDGET_CHAT', '3000')))
+extract_prompts = PromptBuilder(int(os.getenv('PROMPT_BUDGET_EXTRACT', '1024')), message_share=0.8)
+summary_prompts = PromptBuilder(int(os.getenv('PROMPT_BUDGET_SUMMARIZE', '3000')))
+
+if os.getenv('PROMPT_TOKENIZER') == 'tiktoken':
+    set_estimator(tiktoken_estimator())
+
+
+def build_chat_prompt(message: str, history: Optional[Iterable[Dict[str, Any]]] = None, summary: Optional[str] = None) -> str:
+    return chat_prompts.build(CHAT_INSTRUCTION, message, history, summary)
+
+
+def build_summary_prompt(turns: Iterable[Dict[str, Any]], summary: Optional[str] = None) -> str:
+    """Prompt folding `turns` into the previous `summary`; oversized turns are windowed."""
+    turns = list(turns)
+    share = max(16, (summary_prompts.budget - estimate_tokens(SUMMARY_INSTRUCTION)) // (max(1, len(turns)) + 1))
+    lines = [
+        f"{ROLE_LABELS.get(t.get('from'), 'User')}: {truncate_to_tokens(t.get('text') or '', share)}"
+        for t in turns
+    ]
+    previous = truncate_to_tokens(summary, share) if summary else '(none yet)'
+    return f'{SUMMARY_INSTRUCTION}\n\nCurrent summary:\n{previous}\n\nNew turns:\n' + '\n'.join(lines)
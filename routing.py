@@ -0,0 +1,103 @@
+"""Task-aware routing of LLM calls to model/endpoint profiles.
+
+Each task type (slot extraction, chat, prototype generation, summarisation) maps to a
+profile with its own model, optional replica list and default max_tokens/timeout, so
+cheap structured extraction can go to a small fast model while chat keeps the large
+one. Unknown tasks use the `default` profile.
+
+Configuration, later sources overriding earlier ones:
+  1. built-in defaults below
+  2. `LLM_ROUTES_FILE` (JSON file) or `LLM_ROUTES` (inline JSON), e.g.
+     {"extract": {"model": "gemini-flash", "url": "http://small:8100", "max_tokens": 256, "timeout": 5}}
+  3. per-task env vars: LLM_MODEL_<TASK>, LLM_URL_<TASK> (comma separated replicas)
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from .balancer import Balancer
+from .latency import LatencyTracker
+
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    'default': {'max_tokens': 256, 'timeout': 10.0},
+    'extract': {'max_tokens': 256, 'timeout': 5.0},
+    'chat': {'max_tokens': 512, 'timeout': 15.0},
+    'prototype': {'max_tokens': 2048, 'timeout': 60.0},
+    'summarize': {'max_tokens': 384, 'timeout': 30.0},
+}
+
+
+class RouteProfile:
+    __slots__ = ('name', 'model', 'max_tokens', 'timeout', 'balancer', 'latency', 'first_token', 'calls', 'errors')
+
+    def __init__(
+        self,
+        name: str,
+        model: Optional[str] = None,
+        max_tokens: int = 256,
+        timeout: float = 10.0,
+        balancer: Optional[Balancer] = None,
+    ):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.balancer = balancer
+        self.latency = LatencyTracker()
+        # streams: time from request to first token, behind their timeout and hedge point
+        self.first_token = LatencyTracker()
+        self.calls = 0
+        self.errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        out = {'model': self.model, 'calls': self.calls, 'errors': self.errors}
+        out.update(self.latency.stats())
+        if self.first_token.count:
+            out['first_token'] = self.first_token.stats()
+        if self.balancer is not None:
+            out['replicas'] = [r.url for r in self.balancer.replicas]
+        return out
+
+
+class Router:
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None, **balancer_kwargs):
+        config = {name: dict(cfg) for name, cfg in DEFAULT_ROUTES.items()}
+        for name, cfg in (routes or {}).items():
+            config.setdefault(name, {}).update(cfg)
+        self.profiles: Dict[str, RouteProfile] = {}
+        for name, cfg in config.items():
+            urls = cfg.get('urls') or cfg.get('url')
+            if isinstance(urls, str):
+                urls = [u for u in urls.replace(',', ' ').split() if u]
+            self.profiles[name] = RouteProfile(
+                name,
+                model=cfg.get('model'),
+                max_tokens=int(cfg.get('max_tokens', 256)),
+                timeout=float(cfg.get('timeout', 10.0)),
+                balancer=Balancer(urls, **balancer_kwargs) if urls else None,
+            )
+
+    @classmethod
+    def from_env(cls, **balancer_kwargs) -> 'Router':
+        routes: Dict[str, Dict[str, Any]] = {}
+        path = os.getenv('LLM_ROUTES_FILE')
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                routes = json.load(f)
+        elif os.getenv('LLM_ROUTES'):
+            routes = json.loads(os.environ['LLM_ROUTES'])
+        for name in set(DEFAULT_ROUTES) | set(routes):
+            model = os.getenv(f'LLM_MODEL_{name.upper()}')
+            url = os.getenv(f'LLM_URL_{name.upper()}')
+            if model:
+                routes.setdefault(name, {})['model'] = model
+            if url:
+                routes.setdefault(name, {})['url'] = url
+        return cls(routes, **balancer_kwargs)
+
+    def profile(self, task: Optional[str]) -> RouteProfile:
+        return self.profiles.get(task or 'default') or self.profiles['default']
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: p.stats() for name, p in self.profiles.items() if p.calls}
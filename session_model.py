@@ -0,0 +1,278 @@
+"""Compact in-memory representation of sessions and their turn history.
+
+A session used to be a dict holding a list of `{'from', 'text', 'ts'}` dicts, which
+costs several hundred bytes of object overhead per turn. `TurnLog` stores the history
+column-wise instead: role codes in an `array('b')`, timestamps in an `array('d')` and
+the texts in a plain list (short texts interned, so repeated replies share one
+object). It keeps at most `max_turns` turns, dropping the oldest.
+
+`Session` and `Turn` use `__slots__` and expose a dict-compatible view (`s['turns']`,
+`s.get('slots')`, `s.setdefault(...)`, `turn.get('from')`), so code written against
+the old dict layout keeps working. `to_dict()` / `Session.from_dict()` convert to and
+from the JSON layout used by the API and the SQLite store.
+
+Benchmark: `python3 -m polaris.benchmarks.bench_sessions`
+"""
+
+import os
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', '200'))
+
+# texts up to this length are interned ("ok", "sim", canned assistant replies)
+INTERN_MAX_LEN = 64
+
+ROLES: List[str] = ['client', 'assistant', 'system']
+_ROLE_CODES: Dict[str, int] = {r: i for i, r in enumerate(ROLES)}
+
+
+def _role_code(role: str) -> int:
+    code = _ROLE_CODES.get(role)
+    if code is None:
+        if len(ROLES) >= 127:
+            raise ValueError(f'too many distinct turn roles (adding {role!r})')
+        code = _ROLE_CODES[role] = len(ROLES)
+        ROLES.append(role)
+    return code
+
+
+class Turn:
+    """One turn, read through the same keys as the old dict (`from`, `text`, `ts`)."""
+
+    __slots__ = ('role', 'text', 'ts')
+
+    _KEYS = ('from', 'text', 'ts')
+
+    def __init__(self, role: str, text: str, ts: float):
+        self.role = role
+        self.text = text
+        self.ts = ts
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'from':
+            return self.role
+        if key == 'text':
+            return self.text
+        if key == 'ts':
+            return self.ts
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._KEYS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'from': self.role, 'text': self.text, 'ts': self.ts}
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Turn):
+            return (self.role, self.text, self.ts) == (other.role, other.text, other.ts)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'Turn({self.role!r}, {self.text!r}, {self.ts!r})'
+
+
+TurnLike = Union[Turn, Dict[str, Any]]
+
+
+class TurnLog:
+    """Columnar, bounded turn history. Indexing and iteration yield `Turn` objects."""
+
+    __slots__ = ('max_turns', '_roles', '_ts', '_texts')
+
+    def __init__(self, turns: Optional[Iterable[TurnLike]] = None, max_turns: Optional[int] = None):
+        self.max_turns = MAX_TURNS if max_turns is None else max_turns
+        self._roles = array('b')
+        self._ts = array('d')
+        self._texts: List[str] = []
+        for t in turns or ():
+            self.append(t)
+
+    def append(self, turn: TurnLike) -> None:
+        if isinstance(turn, Turn):
+            role, text, ts = turn.role, turn.text, turn.ts
+        else:
+            role, text, ts = turn.get('from') or 'client', turn.get('text') or '', turn.get('ts') or 0.0
+        if len(text) <= INTERN_MAX_LEN:
+            text = sys.intern(text)
+        self._roles.append(_role_code(role))
+        self._ts.append(float(ts))
+        self._texts.append(text)
+        if self.max_turns > 0:
+            self.drop_oldest(len(self._texts) - self.max_turns)
+
+    def extend(self, turns: Iterable[TurnLike]) -> None:
+        for t in turns:
+            self.append(t)
+
+    def drop_oldest(self, n: int) -> None:
+        """Remove the `n` oldest turns (e.g. once they are folded into the summary)."""
+        if n > 0:
+            del self._roles[:n]
+            del self._ts[:n]
+            del self._texts[:n]
+
+    def count_until(self, ts: float) -> int:
+        """Number of leading turns with a timestamp <= `ts`."""
+        n = 0
+        for t in self._ts:
+            if t > ts:
+                break
+            n += 1
+        return n
+
+    def columns(self):
+        """(role codes, timestamps, texts) copies, e.g. for binary snapshots."""
+        roles, ts, texts = self._roles.tobytes(), self._ts.tobytes(), list(self._texts)
+        n = min(len(roles), len(ts) // 8, len(texts))  # tolerate an append racing the copy
+        return roles[:n], ts[:n * 8], texts[:n]
+
+    @classmethod
+    def from_columns(cls, roles: bytes, ts: bytes, texts: List[str], max_turns: Optional[int] = None) -> 'TurnLog':
+        log = cls(max_turns=max_turns)
+        log._roles.frombytes(roles)
+        log._ts.frombytes(ts)
+        log._texts = texts
+        if log.max_turns > 0:
+            log.drop_oldest(len(texts) - log.max_turns)
+        return log
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Turn(ROLES[self._roles[index]], self._texts[index], self._ts[index])
+
+    def __iter__(self) -> Iterator[Turn]:
+        roles = ROLES
+        for code, text, ts in zip(self._roles, self._texts, self._ts):
+            yield Turn(roles[code], text, ts)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [t.to_dict() for t in self]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (TurnLog, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'TurnLog({len(self)} turns, max_turns={self.max_turns})'
+
+
+class Session:
+    """A discovery/chat session with a dict-compatible view.
+
+    `slots` and `summary` count as absent while they are None; keys other than the
+    known fields are kept in a small side dict.
+    """
+
+    __slots__ = ('session_id', 'client_id', 'metadata', 'created_at', 'turns', 'slots', 'summary', '_extra')
+
+    _FIELDS = ('session_id', 'client_id', 'metadata', 'created_at', 'turns', 'slots', 'summary')
+    _OPTIONAL = frozenset(('slots', 'summary'))
+
+    def __init__(
+        self,
+        session_id: str,
+        client_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        created_at: float = 0.0,
+        turns: Optional[Iterable[TurnLike]] = None,
+        slots: Optional[Dict[str, Any]] = None,
+        summary: Optional[str] = None,
+        max_turns: Optional[int] = None,
+    ):
+        self.session_id = session_id
+        self.client_id = client_id
+        self.metadata = metadata if metadata is not None else {}
+        self.created_at = created_at
+        self.turns = turns if isinstance(turns, TurnLog) else TurnLog(turns, max_turns)
+        self.slots = slots
+        self.summary = summary
+        self._extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_turns: Optional[int] = None) -> 'Session':
+        s = cls(
+            data.get('session_id') or '',
+            client_id=data.get('client_id'),
+            metadata=data.get('metadata'),
+            created_at=data.get('created_at') or 0.0,
+            turns=data.get('turns'),
+            slots=data.get('slots'),
+            summary=data.get('summary'),
+            max_turns=max_turns,
+        )
+        for k, v in data.items():
+            if k not in cls._FIELDS:
+                s[k] = v
+        return s
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {k: self[k] for k in self.keys()}
+        out['turns'] = self.turns.to_list()
+        return out
+
+    def keys(self) -> List[str]:
+        keys = [k for k in self._FIELDS if k not in self._OPTIONAL or getattr(self, k) is not None]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELDS:
+            value = getattr(self, key)
+            if value is None and key in self._OPTIONAL:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == 'turns':
+            if not isinstance(value, TurnLog):
+                value = TurnLog(value, self.turns.max_turns)
+            self.turns = value
+        elif key in self._FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # type: ignore[index]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return self[key]
+
+    def __repr__(self) -> str:
+        return f'Session({self.session_id!r}, turns={len(self.turns)})'
@@ -0,0 +1,478 @@
+"""Session storage.
+
+`PolarisAgent.sessions` is a `SessionStore`. Two backends:
+
+- `MemorySessionStore`: bounded by `max_entries` (LRU eviction) and an idle TTL, so a
+  long-running worker keeps a flat memory profile under constant session churn. The
+  map is split into stripes, each with its own lock, so requests on different
+  sessions never contend on one global lock.
+- `SQLiteSessionStore`: sessions serialised as JSON in a SQLite file (WAL mode), for
+  persistence across restarts.
+- `SharedSessionStore`: the SQLite store shared by every worker process on a host
+  (`uvicorn --workers N` with `SESSION_BACKEND=shared`), with a local read cache and
+  cross-process session locks.
+
+Read-modify-write of a session goes through `edit()`, which holds that session's
+striped asyncio lock and writes the session back on exit:
+
+    async with agent.sessions.edit(session_id) as s:
+        s['turns'].append(turn)
+
+`get()` returns the session (or None) and is enough for read-only callers. Sessions are
+`session_model.Session` objects, which also answer the old dict-style access.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from .session_model import Session
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process session locks
+    fcntl = None
+
+SessionData = Union[Session, Dict[str, Any]]
+
+
+def _stripe(session_id: str, n: int) -> int:
+    # crc32 is stable across processes (unlike hash() with PYTHONHASHSEED)
+    return zlib.crc32(session_id.encode('utf-8')) % n
+
+
+class SessionStore:
+    def __init__(self, stripes: int = 64):
+        self._locks = [asyncio.Lock() for _ in range(max(1, stripes))]
+
+    @classmethod
+    def from_env(cls) -> 'SessionStore':
+        stripes = int(os.getenv('SESSION_LOCK_STRIPES', '64'))
+        ttl = float(os.getenv('SESSION_TTL', '86400'))
+        # several workers need a store they can all see. WEB_CONCURRENCY is set by gunicorn
+        # and read (not set) by uvicorn, so `uvicorn --workers N` needs SESSION_BACKEND=shared
+        workers = int(os.getenv('WEB_CONCURRENCY', '1') or 1)
+        backend = os.getenv('SESSION_BACKEND', 'shared' if workers > 1 else 'memory').lower()
+        if backend == 'sqlite':
+            return SQLiteSessionStore(os.getenv('SESSION_DB_PATH', 'sessions.db'), ttl=ttl, stripes=stripes)
+        if backend == 'shared':
+            return SharedSessionStore(
+                os.getenv('SESSION_DB_PATH', 'sessions.db'),
+                ttl=ttl,
+                stripes=stripes,
+                cache_entries=int(os.getenv('SESSION_CACHE_ENTRIES', '1024')),
+            )
+        if backend != 'memory':
+            raise ValueError(f'unknown SESSION_BACKEND: {backend}')
+        return MemorySessionStore(
+            max_entries=int(os.getenv('SESSION_MAX_ENTRIES', '10000')), ttl=ttl, stripes=stripes
+        )
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """The asyncio lock guarding `session_id` (shared with the other ids of its stripe)."""
+        return self._locks[_stripe(session_id, len(self._locks))]
+
+    def _edit_lock(self, session_id: str):
+        return self.lock(session_id)
+
+    @asynccontextmanager
+    async def edit(self, session_id: str) -> AsyncIterator[SessionData]:
+        """Lock, load and yield a session; it is saved back unless the block raises.
+
+        Raises KeyError when the session does not exist.
+        """
+        async with self._edit_lock(session_id):
+            s = self._get_for_edit(session_id)
+            if s is None:
+                raise KeyError('session not found')
+            try:
+                yield s
+            except BaseException:
+                self._discard(session_id)
+                raise
+            self.put(session_id, s)
+
+    def _get_for_edit(self, session_id: str) -> Optional[SessionData]:
+        return self.get(session_id)
+
+    def _discard(self, session_id: str) -> None:
+        """Forget local state for a session whose edit failed half-way."""
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, session: SessionData) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, session_id: object) -> bool:
+        return isinstance(session_id, str) and self.get(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self)}
+
+    def close(self) -> None:
+        pass
+
+
+class _Shard:
+    __slots__ = ('lock', 'items')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session_id -> (last access, session), least recently used first
+        self.items: 'OrderedDict[str, List[Any]]' = OrderedDict()
+
+
+class MemorySessionStore(SessionStore):
+    """In-process sessions with LRU eviction and idle expiry.
+
+    `max_entries` is split evenly across the shards, so eviction is LRU per shard
+    (approximately LRU overall) and needs no global lock.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0, stripes: int = 64):
+        super().__init__(stripes)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._shards = [_Shard() for _ in range(max(1, min(stripes, max_entries)))]
+        self._shard_capacity = max(1, max_entries // len(self._shards))
+        self.evictions = 0
+        self.expirations = 0
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[_stripe(session_id, len(self._shards))]
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        now = time.time()
+        shard = self._shard(session_id)
+        with shard.lock:
+            item = shard.items.get(session_id)
+            if item is None:
+                return None
+            if now - item[0] > self.ttl:
+                del shard.items[session_id]
+                self.expirations += 1
+                return None
+            item[0] = now
+            shard.items.move_to_end(session_id)
+            return item[1]
+
+    def put(self, session_id: str, session: SessionData) -> None:
+        now = time.time()
+        shard = self._shard(session_id)
+        with shard.lock:
+            items = shard.items
+            items[session_id] = [now, session]
+            items.move_to_end(session_id)
+            # idle sessions sit at the front: expire them before evicting live ones
+            while items:
+                oldest_id, oldest = next(iter(items.items()))
+                if now - oldest[0] <= self.ttl:
+                    break
+                del items[oldest_id]
+                self.expirations += 1
+            while len(items) > self._shard_capacity:
+                items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> bool:
+        shard = self._shard(session_id)
+        with shard.lock:
+            return shard.items.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                items = shard.items
+                while items:
+                    oldest_id, oldest = next(iter(items.items()))
+                    if oldest[0] >= cutoff:
+                        break
+                    del items[oldest_id]
+                    removed += 1
+        self.expirations += removed
+        return removed
+
+    def entries(self) -> List[Tuple[str, float, SessionData]]:
+        """(session_id, last access, session) for every session, least recently used first per shard."""
+        out: List[Tuple[str, float, SessionData]] = []
+        for shard in self._shards:
+            with shard.lock:
+                out.extend((sid, item[0], item[1]) for sid, item in shard.items.items())
+        return out
+
+    def load(self, entries) -> int:
+        """Bulk insert `(session_id, last access, session)` keeping access times; skips expired ones."""
+        cutoff = time.time() - self.ttl
+        loaded = 0
+        for session_id, last_access, session in entries:
+            if last_access < cutoff:
+                continue
+            shard = self._shard(session_id)
+            with shard.lock:
+                shard.items[session_id] = [last_access, session]
+                shard.items.move_to_end(session_id)
+                while len(shard.items) > self._shard_capacity:
+                    shard.items.popitem(last=False)
+                    self.evictions += 1
+            loaded += 1
+        return loaded
+
+    def __len__(self) -> int:
+        return sum(len(s.items) for s in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': 'memory',
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions persisted as JSON rows in a SQLite file (WAL mode).
+
+    `get` returns a fresh `Session` loaded from the row, so changes must be written back
+    with `put` (or made inside `edit`). Idle expiry is based on the last write.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400.0, stripes: int = 64, purge_every: int = 1000):
+        super().__init__(stripes)
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL, '
+            'version INTEGER NOT NULL DEFAULT 1)'
+        )
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(sessions)')]
+        if 'version' not in columns:
+            self._db.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)')
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT data, updated_at FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return Session.from_dict(json.loads(row[0]))
+
+    def put(self, session_id: str, session: SessionData) -> None:
+        self._write(session_id, session)
+
+    def _write(self, session_id: str, session: SessionData) -> int:
+        """Upsert a session and return its new row version."""
+        if isinstance(session, Session):
+            session = session.to_dict()
+        data = json.dumps(session, ensure_ascii=False)
+        with self._lock:
+            version = self._db.execute(
+                'INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, '
+                'updated_at = excluded.updated_at, version = sessions.version + 1 '
+                'RETURNING version',
+                (session_id, data, time.time()),
+            ).fetchone()[0]
+            self._writes += 1
+            purge = self.purge_every and self._writes % self.purge_every == 0
+        if purge:
+            self.purge_expired()
+        return version
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cur = self._db.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+            return cur.rowcount > 0
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._db.execute('DELETE FROM sessions WHERE updated_at < ?', (time.time() - self.ttl,))
+            return cur.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'sqlite', 'size': len(self), 'path': self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SharedSessionStore(SQLiteSessionStore):
+    """SQLite sessions shared by all worker processes on a host.
+
+    Every worker opens the same WAL database, so a session created by one worker is
+    visible to the others. Reads are served from a local LRU of decoded sessions. Each
+    entry remembers the `PRAGMA data_version` it was last checked at; when another
+    process has committed since, the entry's row version is re-read before it is
+    trusted. `edit` takes a POSIX byte-range lock on `<path>.locks` for the session's
+    stripe and always checks the row version under it, so read-modify-write stays
+    atomic across workers, not only across tasks.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 86400.0,
+        stripes: int = 64,
+        purge_every: int = 1000,
+        cache_entries: int = 1024,
+        lock_poll: float = 0.005,
+    ):
+        super().__init__(path, ttl=ttl, stripes=stripes, purge_every=purge_every)
+        self.cache_entries = cache_entries
+        self.lock_poll = lock_poll
+        # session_id -> (row version, updated_at, data_version it was checked at, session)
+        self._cache: 'OrderedDict[str, Tuple[int, float, int, Session]]' = OrderedDict()
+        self._lock_fd: Optional[int] = None
+        if fcntl is not None:
+            self._lock_fd = os.open(path + '.locks', os.O_RDWR | os.O_CREAT, 0o644)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.lock_waits = 0
+
+    def _read_data_version(self) -> int:
+        return self._db.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        return self._get(session_id, validate=False)
+
+    def _get_for_edit(self, session_id: str) -> Optional[SessionData]:
+        # under the cross-process lock: always check the row, never trust the cache alone
+        return self._get(session_id, validate=True)
+
+    def _get(self, session_id: str, validate: bool) -> Optional[SessionData]:
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(session_id)
+            data_version = self._read_data_version()
+            if cached is not None and not validate and cached[2] == data_version:
+                # nobody else committed since this entry was last checked: it is current
+                if now - cached[1] > self.ttl:
+                    del self._cache[session_id]
+                    return None
+                self._cache.move_to_end(session_id)
+                self.cache_hits += 1
+                return cached[3]
+            if cached is not None:
+                row = self._db.execute(
+                    'SELECT version, updated_at FROM sessions WHERE session_id = ?', (session_id,)
+                ).fetchone()
+                if row is not None and row[0] == cached[0] and now - row[1] <= self.ttl:
+                    self._remember(session_id, row[0], row[1], cached[3], data_version)
+                    self.cache_hits += 1
+                    return cached[3]
+                del self._cache[session_id]
+            self.cache_misses += 1
+            row = self._db.execute(
+                'SELECT data, updated_at, version FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            session = Session.from_dict(json.loads(row[0]))
+            self._remember(session_id, row[2], row[1], session, data_version)
+            return session
+
+    def put(self, session_id: str, session: SessionData) -> None:
+        version = self._write(session_id, session)
+        if isinstance(session, Session):
+            with self._lock:
+                # our own commits do not move data_version, so the entry stays valid
+                self._remember(session_id, version, time.time(), session, self._read_data_version())
+        else:
+            self._discard(session_id)
+
+    def _remember(self, session_id: str, version: int, updated_at: float, session: Session, data_version: int) -> None:
+        self._cache[session_id] = (version, updated_at, data_version, session)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    def _discard(self, session_id: str) -> None:
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def delete(self, session_id: str) -> bool:
+        self._discard(session_id)
+        return super().delete(session_id)
+
+    def _edit_lock(self, session_id: str):
+        return self._locked(session_id)
+
+    @asynccontextmanager
+    async def _locked(self, session_id: str) -> AsyncIterator[None]:
+        async with self.lock(session_id):
+            if self._lock_fd is None:
+                yield
+                return
+            # the asyncio stripe lock already excludes other tasks of this process, so the
+            # (per-process) POSIX lock on the same byte only has to exclude other workers
+            stripe = _stripe(session_id, len(self._locks))
+            delay = self.lock_poll
+            waited = False
+            while True:
+                try:
+                    fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, stripe)
+                    break
+                except OSError:
+                    waited = True
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+            if waited:
+                self.lock_waits += 1
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripe)
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update({
+            'backend': 'shared',
+            'cache_size': len(self._cache),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'lock_waits': self.lock_waits,
+        })
+        return out
+
+    def close(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        with self._lock:
+            self._cache.clear()
+        super().close()
@@ -0,0 +1,224 @@
+"""Binary snapshots of the in-memory session store.
+
+The memory backend loses every in-flight session on restart. `SessionSnapshotter`
+writes the whole store to a compact length-prefixed file periodically and on shutdown,
+and streams it back on startup (sessions whose idle TTL ran out are skipped).
+
+File layout (little endian):
+
+    b'PLSNAP\\x00\\x01'
+    u32 len, JSON header {'version', 'created_at', 'roles'}
+    per session: u32 len, record
+        f64 last_access, u32 head_len, JSON head (session fields except turns)
+        u32 n, role codes (n bytes), timestamps (8n bytes), text lengths (u32 x n), texts (UTF-8)
+    u32 0  (end marker; a file without it was truncated)
+
+Turn columns are stored exactly as `TurnLog` keeps them in memory, so a restore copies
+buffers instead of building a dict per turn. Writes go to `<path>.tmp` first and are
+renamed into place, so a crash mid-snapshot leaves the previous snapshot intact.
+"""
+
+import asyncio
+import gc
+import json
+import logging
+import os
+import struct
+import time
+from array import array
+from itertools import accumulate
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+from .session_model import ROLES, Session, TurnLog, _role_code
+from .sessions import MemorySessionStore
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PLSNAP\x00\x01'
+_U32 = struct.Struct('<I')
+_RECORD_HEAD = struct.Struct('<dI')
+_json_decode = json.JSONDecoder().decode
+
+
+def _encode(last_access: float, session: Any) -> bytes:
+    if not isinstance(session, Session):
+        session = Session.from_dict(session)
+    head = {k: session[k] for k in session.keys() if k != 'turns'}
+    head_bytes = json.dumps(head, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    roles, ts, texts = session.turns.columns()
+    lengths = array('I', [len(t) for t in texts])
+    return b''.join((
+        _RECORD_HEAD.pack(last_access, len(head_bytes)),
+        head_bytes,
+        _U32.pack(len(roles)),
+        roles,
+        ts,
+        lengths.tobytes(),
+        ''.join(texts).encode('utf-8', 'surrogatepass'),
+    ))
+
+
+def _decode(rec: bytes, role_table: Optional[bytes], max_turns: Optional[int]) -> Tuple[str, float, Session]:
+    last_access, head_len = _RECORD_HEAD.unpack_from(rec, 0)
+    off = _RECORD_HEAD.size
+    head: Dict[str, Any] = _json_decode(rec[off:off + head_len].decode('utf-8'))
+    off += head_len
+    (n,) = _U32.unpack_from(rec, off)
+    off += 4
+    roles = rec[off:off + n]
+    off += n
+    if role_table is not None:
+        roles = roles.translate(role_table)
+    ts = rec[off:off + 8 * n]
+    off += 8 * n
+    lengths = array('I')
+    lengths.frombytes(rec[off:off + 4 * n])
+    off += 4 * n
+    blob = rec[off:].decode('utf-8', 'surrogatepass')
+    ends = list(accumulate(lengths))
+    texts = [blob[a:b] for a, b in zip([0] + ends, ends)]
+    head['turns'] = TurnLog.from_columns(roles, ts, texts, max_turns)
+    return head.get('session_id') or '', last_access, Session.from_dict(head)
+
+
+def write_snapshot(store: MemorySessionStore, path: str) -> int:
+    """Write every session of `store` to `path` atomically; returns the number written."""
+    tmp = path + '.tmp'
+    count = 0
+    with open(tmp, 'wb') as f:
+        header = json.dumps({'version': 1, 'created_at': time.time(), 'roles': list(ROLES)}).encode('utf-8')
+        f.write(MAGIC)
+        f.write(_U32.pack(len(header)))
+        f.write(header)
+        for _session_id, last_access, session in store.entries():
+            rec = _encode(last_access, session)
+            f.write(_U32.pack(len(rec)))
+            f.write(rec)
+            count += 1
+        f.write(_U32.pack(0))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def _read_exact(f: BinaryIO, n: int) -> Optional[bytes]:
+    data = f.read(n)
+    return data if len(data) == n else None
+
+
+def iter_snapshot(path: str, max_turns: Optional[int] = None) -> Iterator[Tuple[str, float, Session]]:
+    """Stream `(session_id, last access, session)` from a snapshot file, one record at a time."""
+    with open(path, 'rb', buffering=1 << 20) as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a session snapshot')
+        raw = _read_exact(f, 4)
+        header_bytes = _read_exact(f, _U32.unpack(raw)[0]) if raw else None
+        if header_bytes is None:
+            raise ValueError(f'{path} is truncated')
+        header = json.loads(header_bytes)
+        roles = header.get('roles') or []
+        role_table = None
+        if roles != ROLES[:len(roles)]:
+            # role codes are assigned per process: remap the snapshot's codes to ours
+            table = bytearray(range(256))
+            for code, role in enumerate(roles):
+                table[code] = _role_code(role)
+            role_table = bytes(table)
+        while True:
+            raw = _read_exact(f, 4)
+            if raw is None:
+                logger.warning('session snapshot %s is truncated; restored the complete records only', path)
+                return
+            (length,) = _U32.unpack(raw)
+            if length == 0:
+                return
+            rec = _read_exact(f, length)
+            if rec is None:
+                logger.warning('session snapshot %s is truncated; restored the complete records only', path)
+                return
+            yield _decode(rec, role_table, max_turns)
+
+
+def restore_snapshot(store: MemorySessionStore, path: str) -> int:
+    # millions of new long-lived objects would otherwise trigger repeated full GC passes
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return store.load(iter_snapshot(path))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class SessionSnapshotter:
+    """Periodic + on-shutdown snapshots of a `MemorySessionStore`, restored on start."""
+
+    def __init__(self, store: MemorySessionStore, path: str, interval: float = 300.0):
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.snapshots = 0
+        self.last_snapshot: Dict[str, Any] = {}
+        self.last_restore: Dict[str, Any] = {}
+
+    async def restore(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            self.last_restore = {'sessions': 0, 'seconds': 0.0}
+            return self.last_restore
+        start = time.perf_counter()
+        count = await asyncio.to_thread(restore_snapshot, self.store, self.path)
+        elapsed = time.perf_counter() - start
+        self.last_restore = {'sessions': count, 'seconds': round(elapsed, 3)}
+        logger.info('restored %d sessions from %s in %.3fs', count, self.path, elapsed)
+        return self.last_restore
+
+    async def snapshot(self) -> int:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            start = time.perf_counter()
+            count = await asyncio.to_thread(write_snapshot, self.store, self.path)
+            elapsed = time.perf_counter() - start
+        self.snapshots += 1
+        self.last_snapshot = {'sessions': count, 'seconds': round(elapsed, 3), 'at': time.time()}
+        logger.info('wrote %d sessions to %s in %.3fs', count, self.path, elapsed)
+        return count
+
+    async def start(self) -> Dict[str, Any]:
+        """Restore the last snapshot, then snapshot every `interval` seconds."""
+        restored = await self.restore()
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+        return restored
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.shield(self.snapshot())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('session snapshot failed', exc_info=True)
+
+    async def aclose(self) -> None:
+        """Stop the periodic task and write a final snapshot."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.snapshot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'snapshots': self.snapshots,
+            'last_snapshot': self.last_snapshot,
+            'last_restore': self.last_restore,
+        }
@@ -0,0 +1,114 @@
+"""Incremental Server-Sent Events decoder.
+
+Works directly on the raw byte chunks of a streaming response: chunks may split lines,
+field names or UTF-8 sequences anywhere, and only complete lines are decoded. Supports
+the full line format of the SSE spec (`data`, `event`, `id`, `retry`, `:` comments,
+multi-line `data`, and `\\r\\n` / `\\n` / `\\r` line endings).
+
+`loads` is the fastest JSON decoder available (orjson when installed, else the stdlib).
+"""
+
+import re
+from typing import List, Optional
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:  # pragma: no cover - depends on the environment
+    import json
+
+    loads = json.loads
+    JSON_BACKEND = 'json'
+
+_NEWLINE = re.compile(rb'\r\n|\r|\n')
+
+
+class SSEEvent:
+    __slots__ = ('event', 'data', 'id', 'retry')
+
+    def __init__(self, event: str, data: str, id: Optional[str], retry: Optional[int]):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    def __repr__(self) -> str:
+        return f'SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})'
+
+
+class SSEDecoder:
+    def __init__(self):
+        self._buf = bytearray()
+        self._data: List[bytes] = []
+        self._event: Optional[str] = None
+        self._retry: Optional[int] = None
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Consume a chunk and return the events it completed (possibly none)."""
+        buf = self._buf
+        buf += chunk
+        events: List[SSEEvent] = []
+        start = 0
+        search = _NEWLINE.search
+        end = len(buf)
+        while True:
+            m = search(buf, start)
+            if m is None:
+                break
+            # a trailing '\r' may be the first half of '\r\n' split across chunks
+            if m.end() == end and buf[m.start()] == 13 and m.end() - m.start() == 1:
+                break
+            line = bytes(buf[start:m.start()])
+            start = m.end()
+            if not line:
+                ev = self._dispatch()
+                if ev is not None:
+                    events.append(ev)
+            else:
+                self._field(line)
+        if start:
+            del buf[:start]
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """Dispatch whatever is pending at end of stream (tolerates a missing blank line)."""
+        if self._buf:
+            line = bytes(self._buf).rstrip(b'\r')
+            self._buf.clear()
+            if line:
+                self._field(line)
+        ev = self._dispatch()
+        return [ev] if ev is not None else []
+
+    def _field(self, line: bytes) -> None:
+        if line[0] == 58:  # ':' comment / keep-alive
+            return
+        colon = line.find(b':')
+        if colon < 0:
+            name, value = line, b''
+        else:
+            name = line[:colon]
+            value = line[colon + 2:] if line[colon + 1:colon + 2] == b' ' else line[colon + 1:]
+        if name == b'data':
+            self._data.append(value)
+        elif name == b'event':
+            self._event = value.decode('utf-8', 'replace')
+        elif name == b'id':
+            if b'\0' not in value:
+                self.last_event_id = value.decode('utf-8', 'replace')
+        elif name == b'retry':
+            if value.isdigit():
+                self._retry = int(value)
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._data:
+            self._event = None
+            return None
+        data = self._data[0] if len(self._data) == 1 else b'\n'.join(self._data)
+        ev = SSEEvent(self._event or 'message', data.decode('utf-8', 'replace'), self.last_event_id, self._retry)
+        self._data = []
+        self._event = None
+        return ev
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.balancer import Balancer
+
+
+def test_picks_least_loaded_fast_replica_and_ejects_failing_ones():
+    b = Balancer(['http://a', 'http://b', 'http://c'], eject_after=2)
+    a, bb, c = b.replicas
+    a.latency_ewma, bb.latency_ewma, c.latency_ewma = 0.1, 0.1, 1.0
+    first = b.acquire()
+    assert first is a
+    assert b.acquire() is bb          # a is busy now, b is equally fast
+    b.release(bb, None, False)
+    b.release(b.acquire(), None, False)  # b again, second consecutive error
+    assert b.stats()['http://b']['ejected'] is True
+    assert b.pick() is not bb
+
+
+@pytest.mark.asyncio
+async def test_agent_balances_calls_across_llm_url_list():
+    hits = []
+
+    def handler(request):
+        hits.append(request.url.host)
+        if request.url.host == 'bad':
+            return httpx.Response(500)
+        return httpx.Response(200, json={'text': 'ok'})
+
+    agent = PolarisAgent(llm_url='http://bad, http://good')
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    results = [await agent.call_llm(f'p{i}', hedge=False) for i in range(8)]
+
+    assert hits.count('bad') == agent.balancer.eject_after
+    assert sum(r['ok'] for r in results) == 8 - agent.balancer.eject_after
+    assert set(agent.metrics()['llm_replicas']) == {'http://bad', 'http://good'}
+    await agent.aclose()
@@ -0,0 +1,82 @@
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.breaker import CircuitBreaker
+from polaris.fast_extract import extract, extract_slots
+
+
+def test_breaker_opens_and_half_open_probe_restores(monkeypatch):
+    import polaris.breaker as mod
+    now = [100.0]
+    monkeypatch.setattr(mod.time, 'monotonic', lambda: now[0])
+
+    b = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    for _ in range(2):
+        assert b.allow()
+        b.record_failure()
+    assert b.state == 'open' and not b.allow()
+
+    now[0] += 11
+    assert b.allow()          # the single half-open probe
+    assert not b.allow()
+    b.record_success()
+    assert b.state == 'closed' and b.allow()
+
+
+def test_fast_extractor_budget_kpi_users():
+    slots = extract_slots('Temos R$ 50.000 e queremos reduzir churn entre usuários mobile')
+    assert slots['budget'] == '50000'
+    assert slots['kpi'] == 'retenção'
+    assert slots['users'] == 'usuários mobile'
+    assert extract_slots('uns 30k pra melhorar conversão')['budget'] == '30000'
+
+
+def test_fast_extractor_budget_needs_money_context():
+    for text in ('No orçamento somos 3 pessoas', 'lançamento em 2025', 'orçamento para 2025',
+                 'Temos 5 mil usuários', '10k acessos por dia'):
+        assert 'budget' not in extract(text)[0], text
+    # a bare multiplier or a bare number after the keyword is left to the LLM
+    for text in ('uns 30k pra melhorar conversão', 'orçamento de 5000'):
+        assert extract(text)[1]['budget'] < 0.75, text  # FAST_EXTRACT_THRESHOLD default
+    for text, value in (('R$ 50.000', '50000'), ('20 mil reais', '20000'), ('Orçamento de 20 mil', '20000')):
+        slots, conf = extract(text)
+        assert slots['budget'] == value and conf['budget'] >= 0.9, text
+
+
+@pytest.mark.asyncio
+async def test_discovery_uses_local_extractor_while_circuit_is_open():
+    agent = PolarisAgent(llm_url='http://llm', breaker=CircuitBreaker(failure_threshold=1))
+    agent.breaker.record_failure()
+
+    async def must_not_call(*args, **kwargs):
+        raise AssertionError('LLM called while the circuit is open')
+        yield
+
+    agent.call_llm_stream = must_not_call
+    sid = agent.create_session()
+    out = await agent.ask_discovery_questions(sid, 'Orçamento de 20 mil, foco em retenção')
+    assert out['slots'] == {'budget': '20000', 'kpi': 'retenção', '_confidence': {'budget': 0.9, 'kpi': 0.9}}
+    assert out['complete'] is False
+
+
+@pytest.mark.asyncio
+async def test_low_confidence_degraded_guesses_are_asked_again_after_recovery():
+    agent = PolarisAgent(llm_url='http://llm', breaker=CircuitBreaker(failure_threshold=1))
+    agent.breaker.record_failure()
+    session = {'slots': {}}
+    await agent._extract_slots_from_message(session, 'uns 30k pra melhorar conversão')
+    assert session['slots']['budget'] == '30000'
+    assert session['slots']['_confidence']['budget'] < agent.fast_extract_threshold
+
+    agent.breaker.record_success()
+    prompts = []
+
+    async def fake_call_llm_stream(prompt, **kwargs):
+        prompts.append(prompt)
+        yield {'type': 'token', 'text': '{"budget": "30000 por trimestre"}'}
+        yield {'type': 'done'}
+
+    agent.call_llm_stream = fake_call_llm_stream
+    await agent._extract_slots_from_message(session, 'ok')
+    assert len(prompts) == 1 and 'budget' in prompts[0]
+    assert session['slots']['budget'] == '30000 por trimestre'
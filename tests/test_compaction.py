@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.compaction import SessionCompactor
+from polaris.prompting import build_chat_prompt
+from polaris.sessions import MemorySessionStore
+
+
+@pytest.mark.asyncio
+async def test_long_sessions_are_summarised_in_the_background(monkeypatch):
+    monkeypatch.setenv('SUMMARY_TURN_THRESHOLD', '10')
+    monkeypatch.setenv('SUMMARY_KEEP_TURNS', '4')
+    agent = PolarisAgent(llm_url='http://llm', sessions=MemorySessionStore())
+    prompts = []
+    release = asyncio.Event()
+
+    async def fake_call_llm(prompt, task=None, **kwargs):
+        prompts.append((task, prompt))
+        await release.wait()
+        return {'ok': True, 'text': ' Cliente quer reduzir churn; orçamento 20 mil. '}
+
+    agent.call_llm = fake_call_llm
+    sid = agent.create_session()
+    async with agent.sessions.edit(sid) as s:
+        for i in range(10):
+            agent.append_turn(s, 'client' if i % 2 == 0 else 'assistant', f'turno {i}')
+    await asyncio.sleep(0)
+    assert len(prompts) == 1 and prompts[0][0] == 'summarize'
+    assert 'turno 5' in prompts[0][1] and 'turno 6' not in prompts[0][1]
+
+    # the request path keeps appending while the summary is generated
+    async with agent.sessions.edit(sid) as s:
+        agent.append_turn(s, 'client', 'turno 10')
+    release.set()
+    for _ in range(50):
+        await asyncio.sleep(0)
+        if agent.compactor.stats()['compactions']:
+            break
+
+    s = agent.sessions.get(sid)
+    assert s['summary'] == 'Cliente quer reduzir churn; orçamento 20 mil.'
+    assert [t['text'] for t in s['turns']] == ['turno 6', 'turno 7', 'turno 8', 'turno 9', 'turno 10']
+    assert 'Conversation summary:\nCliente quer reduzir churn' in build_chat_prompt('ok', list(s['turns']), s['summary'])
+    assert agent.metrics()['compaction']['turns_compacted'] == 6
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_keeps_turns(monkeypatch):
+    monkeypatch.setenv('SUMMARY_TURN_THRESHOLD', '3')
+    monkeypatch.setenv('SUMMARY_KEEP_TURNS', '1')
+    monkeypatch.setenv('SUMMARY_MIN_FOLD_TURNS', '1')
+    agent = PolarisAgent(llm_url='http://llm', sessions=MemorySessionStore())
+
+    async def failing_call_llm(prompt, **kwargs):
+        return {'ok': False, 'error': 'circuit_open'}
+
+    agent.call_llm = failing_call_llm
+    sid = agent.create_session()
+    s = agent.sessions.get(sid)
+    for i in range(3):
+        agent.append_turn(s, 'client', f'turno {i}')
+    assert await agent.compactor.compact(sid) is False
+    assert len(s['turns']) == 3 and 'summary' not in s
+    await agent.aclose()
+
+
+def test_only_foldable_turns_count_towards_the_token_threshold():
+    compactor = SessionCompactor(
+        MemorySessionStore(), summarize=None, turn_threshold=0, token_threshold=50, keep_turns=4, min_fold_turns=2
+    )
+    long_text = 'palavra ' * 100
+    session = {'turns': [{'text': long_text} for _ in range(4)]}
+    assert not compactor.needs_compaction(session)  # the kept turns alone never trigger it
+
+    session['turns'].append({'text': 'ok'})
+    assert not compactor.needs_compaction(session)  # one long turn to fold: below the low-water mark
+    session['turns'].append({'text': 'ok'})
+    assert compactor.needs_compaction(session)
+
+    session['turns'] = [{'text': 'ok'}] * 3 + [{'text': long_text}] * 4
+    assert not compactor.needs_compaction(session)  # enough turns to fold, but they are short
@@ -0,0 +1,129 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import httpx
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from polaris.adapters import embeddings
+from polaris.embedding_cache import EmbeddingCache
+
+
+def test_lookup_is_keyed_by_normalized_text_and_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'emb'))
+    assert cache.put('Hotel  em Gramado\n', [0.5, 1.5]) == 1
+    v = cache.get('Hotel em Gramado')
+    assert v.dtype == np.float32 and v.tolist() == [0.5, 1.5]
+    assert not v.flags.writeable  # a view into the read-only mapping
+    assert cache.get('hotel em gramado') is None
+    assert cache.get('Hotel em Gramado', model='other') is None
+    assert cache.put('Hotel em Gramado', [9.0, 9.0]) == 0  # already stored
+    assert cache.stats()['hits'] == 1
+
+
+def test_vectors_survive_reopen_and_are_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / 'emb')
+    writer = EmbeddingCache(path)
+    reader = EmbeddingCache(path, readonly=True)
+    writer.put_many(['a', 'b'], [[1.0], [2.0]])
+    assert reader.get('b').tolist() == [2.0]  # picked up on the miss
+    assert reader.put('c', [3.0]) == 0
+    writer.close()
+    reopened = EmbeddingCache(path)
+    assert len(reopened) == 2 and reopened.get('a').tolist() == [1.0]
+
+
+def test_non_blocking_lookups_treat_a_held_lock_as_a_miss(tmp_path):
+    path = str(tmp_path / 'emb')
+    cache = EmbeddingCache(path)
+    cache.put('a', [1.0])
+    holder = subprocess.Popen(
+        [sys.executable, '-c', 'import fcntl, sys; f = open(sys.argv[1], "r+"); '
+         'fcntl.lockf(f, fcntl.LOCK_EX); print("locked", flush=True); sys.stdin.read()', path + '.lock'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == 'locked'
+        got = cache.get_many(['a', 'b'], blocking=False)  # would wait on the refresh otherwise
+        assert got[0].tolist() == [1.0] and got[1] is None
+    finally:
+        holder.communicate('')
+
+    with cache._lock:
+        t = threading.Thread(target=lambda: got.append(cache.get('a', blocking=False)))
+        t.start()
+        t.join(timeout=5)
+    assert not t.is_alive() and got[-1] is None
+    assert cache.get('a', blocking=False).tolist() == [1.0]
+
+def test_compaction_bounds_the_file_and_keeps_recently_used(tmp_path):
+    path = str(tmp_path / 'emb')
+    cache = EmbeddingCache(path, max_bytes=4096, compact_ratio=0.5)
+    other = EmbeddingCache(path)
+    cache.put('hot', np.ones(64))
+    for i in range(20):
+        cache.get('hot')
+        cache.put(f'text {i}', np.full(64, i))
+    assert cache.stats()['compactions'] >= 1
+    assert os.path.getsize(path + '.vec') <= 4096
+    assert cache.get('hot') is not None
+    assert cache.get('text 19').tolist() == [19.0] * 64
+    assert other.get('text 19').tolist() == [19.0] * 64  # reopened after the rename
+
+
+@pytest.mark.asyncio
+async def test_adapter_sends_only_the_misses(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, 'EMBEDDING_CONTRACT_PATH', str(tmp_path / 'contract.json'))
+    monkeypatch.setattr(embeddings, '_resolved', None)
+    monkeypatch.setattr(embeddings, '_cache', EmbeddingCache(str(tmp_path / 'emb')))
+    sent = []
+
+    def handler(request):
+        inputs = json.loads(request.content)['inputs']
+        sent.append(inputs)
+        return httpx.Response(200, json={'embeddings': [[float(len(t))] for t in inputs]})
+
+    monkeypatch.setattr(embeddings, '_build_client', lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    assert await embeddings.aget_embedding(['ab', 'abc']) == [[2.0], [3.0]]
+    assert await embeddings.aget_embedding(['abc', 'abcd']) == [[3.0], [4.0]]
+    assert await embeddings.aembed('ab') == [2.0]
+    assert sent == [['ab', 'abc'], ['abcd']]
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_adapter_opens_the_cache_off_the_loop_and_stats_never_wait(tmp_path, monkeypatch):
+    import polaris.embedding_cache as mod
+    monkeypatch.setattr(embeddings, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'emb'))
+    monkeypatch.setattr(embeddings, '_cache', None)
+    opened_on = []
+    real_init = mod.EmbeddingCache.__init__
+
+    def init(self, *args, **kwargs):
+        opened_on.append(threading.current_thread())
+        real_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(mod.EmbeddingCache, '__init__', init)
+    cache = await embeddings.aget_cache()
+    assert opened_on == [opened_on[0]] and opened_on[0] is not threading.main_thread()
+    assert await embeddings.aget_cache() is cache
+
+    held, release = threading.Event(), threading.Event()
+
+    def writer():  # e.g. a put_many or compaction in a worker thread
+        with cache._lock:
+            held.set()
+            release.wait(5)
+
+    t = threading.Thread(target=writer)
+    t.start()
+    held.wait(5)
+    try:
+        assert embeddings.cache_stats()['entries'] == 0
+    finally:
+        release.set()
+        t.join()
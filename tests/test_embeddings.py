@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from polaris.adapters import embeddings
+
+
+@pytest.fixture(autouse=True)
+def contract_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'embedding_contract.json')
+    monkeypatch.setattr(embeddings, 'EMBEDDING_CONTRACT_PATH', path)
+    monkeypatch.setattr(embeddings, '_resolved', None)
+    return path
+
+
+def mock_service(monkeypatch, routes):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        route = routes.get(request.url.path)
+        if route is None:
+            return httpx.Response(404)
+        return httpx.Response(200, json=route(json.loads(request.content)))
+
+    monkeypatch.setattr(embeddings, '_build_client', lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_async_api_normalises_response_shapes(monkeypatch):
+    calls = mock_service(monkeypatch, {
+        '/embeddings': lambda body: {'data': [{'embedding': [float(len(t))]} for t in body['inputs']]},
+        '/v1/upsert': lambda body: {'ok': True},
+        '/v1/query': lambda body: {'matches': [{'id': 'p1', 'score': 0.9}][:body['top_k']]},
+    })
+    assert await embeddings.aget_embedding(['ab', 'abc']) == [[2.0], [3.0]]
+    assert await embeddings.aupsert_vector('p1', [0.1], {'title': 'x'}) is True
+    assert await embeddings.asearch_vector([0.1], top_k=1) == [{'id': 'p1', 'score': 0.9}]
+    assert calls[:2] == ['/v1/embeddings', '/embeddings']
+
+    # concurrent calls share one pooled client for this loop
+    first = embeddings._get_client()
+    await asyncio.gather(*[embeddings.aget_embedding(['a']) for _ in range(5)])
+    assert embeddings._get_client() is first
+    await embeddings.aclose()
+
+
+def test_sync_wrapper_runs_outside_an_event_loop(monkeypatch):
+    mock_service(monkeypatch, {'/v1/embeddings': lambda body: {'embeddings': [[1.0, 2.0]]}})
+    assert embeddings.get_embedding(['oi']) == [[1.0, 2.0]]
+
+
+@pytest.mark.asyncio
+async def test_resolved_paths_are_persisted_and_reprobed_only_after_an_error(monkeypatch, contract_file):
+    routes = {'/embed': lambda body: {'embeddings': [[0.5]]}}
+    calls = mock_service(monkeypatch, routes)
+    await embeddings.aget_embedding(['a'])
+    assert calls == ['/v1/embeddings', '/embeddings', '/v1/embed', '/embed']
+
+    # a fresh process reads the contract file: one request per call from the start
+    monkeypatch.setattr(embeddings, '_resolved', None)
+    calls.clear()
+    for _ in range(3):
+        assert await embeddings.aget_embedding(['a']) == [[0.5]]
+    assert calls == ['/embed'] * 3
+    assert embeddings.load_contract(contract_file) == {'embed': '/embed'}
+
+    # the service moved the route: 404 on the known path triggers one re-probe
+    routes['/v1/embeddings'] = routes.pop('/embed')
+    calls.clear()
+    assert await embeddings.aget_embedding(['a']) == [[0.5]]
+    assert calls == ['/embed', '/v1/embeddings']
+    assert embeddings.load_contract(contract_file) == {'embed': '/v1/embeddings'}
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_aembed_calls_share_one_request(monkeypatch):
+    calls = mock_service(monkeypatch, {
+        '/v1/embeddings': lambda body: {'embeddings': [[float(len(t))] for t in body['inputs']]},
+    })
+    monkeypatch.setattr(embeddings, 'EMBEDDING_BATCH_SIZE', 4)
+    texts = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+    vectors = await asyncio.gather(*[embeddings.aembed(t) for t in texts])
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert len(calls) == 2  # one full batch of 4, then the deadline flushes the last one
+    stats = embeddings.batch_stats()['default']
+    assert stats['batch_sizes'] == {1: 1, 4: 1}
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_aembed_splits_batches_by_token_budget(monkeypatch):
+    sizes = []
+
+    def embed(body):
+        sizes.append(len(body['inputs']))
+        return {'embeddings': [[0.0] for _ in body['inputs']]}
+
+    mock_service(monkeypatch, {'/v1/embeddings': embed})
+    monkeypatch.setattr(embeddings, 'EMBEDDING_BATCH_TOKENS', 10)
+    texts = ['x' * 20] * 4  # ~5 tokens each
+    assert len(await embeddings.aembed_many(texts, model='m')) == 4
+    assert sizes == [2, 2]
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_batches_retries_and_reports_per_item(monkeypatch):
+    monkeypatch.setattr(embeddings, 'EMBEDDING_UPSERT_BACKOFF', 0)
+    monkeypatch.setattr(embeddings, '_resolved', {'upsert': '/v1/upsert'})
+    batches, failures = [], {'left': 1}
+    in_flight = {'now': 0, 'max': 0}
+
+    async def handler(request):
+        if request.url.path != '/v1/upsert':
+            return httpx.Response(404)
+        ids = [item['id'] for item in json.loads(request.content)['items']]
+        in_flight['now'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+        if 'bad' in ids:
+            return httpx.Response(400)
+        if ids[0] == 'p2' and failures['left']:
+            failures['left'] -= 1
+            return httpx.Response(503)
+        batches.append(ids)
+        return httpx.Response(200, json={'ok': True})
+
+    monkeypatch.setattr(embeddings, '_build_client', lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def items():
+        for i in range(6):
+            yield {'id': f'p{i}', 'vector': [0.1, 0.2], 'metadata': {'i': i}}
+        yield ('bad', [0.0])
+
+    statuses = await embeddings.aupsert_vectors(items(), batch_size=2, concurrency=2)
+    assert sorted(batches) == [['p0', 'p1'], ['p2', 'p3'], ['p4', 'p5']]  # p2/p3 after one retry
+    assert in_flight['max'] == 2
+    assert [s['id'] for s in statuses] == ['p0', 'p1', 'p2', 'p3', 'p4', 'p5', 'bad']
+    assert all(s['ok'] for s in statuses[:6])
+    assert statuses[6]['ok'] is False and '400' in statuses[6]['error']
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_bounds_batches_by_payload_size(monkeypatch):
+    sizes = mock_service(monkeypatch, {'/v1/upsert': lambda body: {'n': len(body['items'])}})
+    vector = [0.123456] * 50
+    statuses = await embeddings.aupsert_vectors(((i, vector) for i in range(10)), max_bytes=1500)
+    assert all(s['ok'] for s in statuses)
+    assert len(sizes) == 5  # ~500 bytes of JSON per item: 2 items per request
+    await embeddings.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_reports_malformed_items_without_aborting(monkeypatch):
+    sent = []
+    mock_service(monkeypatch, {'/v1/upsert': lambda body: sent.extend(i['id'] for i in body['items']) or {'ok': True}})
+    items = [
+        {'id': 'a', 'vector': [0.1]},
+        {'vector': [0.2]},                      # no id
+        ('b',),                                 # no vector
+        ('c', [0.3], {'when': object()}),       # metadata is not JSON
+        ('d', [0.4]),
+    ]
+    statuses = await embeddings.aupsert_vectors(items, batch_size=2)
+    assert [s['id'] for s in statuses] == ['a', None, 'b', 'c', 'd']
+    assert [s['ok'] for s in statuses] == [True, False, False, False, True]
+    assert all(s['error'].startswith('invalid item') for s in statuses[1:4])
+    assert sent == ['a', 'd']
+    await embeddings.aclose()
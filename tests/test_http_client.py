@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from polaris.agent_core import PolarisAgent
+
+
+@pytest.mark.asyncio
+async def test_client_is_created_lazily_and_reused_within_a_loop():
+    agent = PolarisAgent(llm_url='http://llm')
+    assert agent._client is None
+
+    client = agent._get_client()
+    assert agent._get_client() is client
+    assert agent._client_loop is asyncio.get_running_loop()
+
+    await agent.aclose()
+    assert client.is_closed
+    assert agent._client is None and agent._client_loop is None
+    assert agent._get_client() is not client  # usable again after a close
+
+
+@pytest.mark.asyncio
+async def test_start_opens_the_shared_client():
+    agent = PolarisAgent(llm_url='http://llm')
+    await agent.start()
+    client = agent._client
+    assert client is not None and not client.is_closed
+    assert agent._get_client() is client
+    await agent.aclose()
+    assert client.is_closed
+
+
+def test_each_event_loop_gets_its_own_client():
+    agent = PolarisAgent(llm_url='http://llm')
+
+    async def grab():
+        return agent._get_client()
+
+    first = asyncio.run(grab())
+    second = asyncio.run(grab())
+    assert second is not first
+    assert agent._client is second
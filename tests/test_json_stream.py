@@ -0,0 +1,46 @@
+from polaris.json_stream import IncrementalJSONParser
+
+
+def test_members_reported_as_they_complete_ignoring_fences():
+    p = IncrementalJSONParser()
+    assert p.feed('Aqui está:\n```json\n{"pain": "atra') == []
+    assert p.feed('sos", "budget": 1') == [('pain', 'atrasos')]
+    assert p.feed('0000, "kpi": {"nome": "NPS"}}\n```') == [('budget', 10000), ('kpi', {'nome': 'NPS'})]
+    assert p.done
+    assert p.feed('{"ignored": 1}') == []
+
+
+def test_char_by_char_array_and_close_completes_trailing_scalar():
+    text = '[{"index": 1, "kpi": "conversão"}, 42, {"index": 2, "budget": "5 mil \\"aprox\\""}, 7'
+    p = IncrementalJSONParser()
+    events = []
+    for ch in text:
+        events.extend(p.feed(ch))
+    events.extend(p.close())
+    assert [v for _, v in events] == [
+        {'index': 1, 'kpi': 'conversão'}, 42, {'index': 2, 'budget': '5 mil "aprox"'}, 7]
+    assert p.done
+
+
+def test_invalid_members_are_skipped():
+    p = IncrementalJSONParser()
+    p.feed('{"pain": undefined, "users": "lojistas"}')
+    assert p.result == {'users': 'lojistas'}
+
+
+def test_stray_closers_and_garbage_between_array_members_are_skipped():
+    p = IncrementalJSONParser()
+    events = p.feed('[{"index":1}}, {"index":2}]')
+    assert [v for _, v in events] == [{'index': 1}, {'index': 2}] and p.done
+
+    p = IncrementalJSONParser()
+    p.feed('[1, }} ]]')
+    assert p.result == [1] and p.done  # the first `]` closes the array
+
+    p = IncrementalJSONParser()
+    p.feed('[1, nope } {"index": 2} 3]')
+    assert p.result == [1, {'index': 2}, 3]
+
+    p = IncrementalJSONParser()
+    p.feed('{"pain": }')
+    assert p.result == {} and p.done
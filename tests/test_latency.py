@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.breaker import CircuitBreaker
+from polaris.latency import LatencyTracker
+
+
+def test_tracker_rolling_percentiles():
+    t = LatencyTracker(window=100)
+    for i in range(1, 201):
+        t.record(i / 1000.0)
+    # only the last 100 samples (101..200 ms) remain in the window
+    assert t.percentile(50) == pytest.approx(0.150)
+    assert t.percentile(99) == pytest.approx(0.199)
+    assert t.count == 200
+
+
+def test_tracker_samples_age_out():
+    now = [0.0]
+    t = LatencyTracker(window=100, max_age=60.0, clock=lambda: now[0])
+    for _ in range(50):
+        t.record(0.5)
+    now[0] = 30.0
+    t.record(0.01)
+    assert t.percentile(50) == 0.5
+    now[0] = 61.0
+    assert len(t) == 1 and t.percentile(99) == 0.01
+
+
+@pytest.mark.asyncio
+async def test_adaptive_timeout_widens_after_a_latency_step():
+    agent = PolarisAgent(llm_url='http://llm', hedge=False, breaker=CircuitBreaker(failure_threshold=1000))
+    agent.timeout_min = 0.01
+    delay = {'s': 0.02}
+
+    async def handler(request):
+        # MockTransport does not enforce timeouts: apply the request's read timeout here
+        limit = request.extensions['timeout']['read']
+        await asyncio.sleep(min(delay['s'], limit))
+        if delay['s'] > limit:
+            raise httpx.ReadTimeout('timed out', request=request)
+        return httpx.Response(200, json={'text': 'ok'})
+
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    for _ in range(25):
+        assert (await agent._call_llm_upstream('p', 8, 0.0, None, None))['ok']
+    fast_timeout = agent._adaptive_timeout(agent.llm_url)
+    assert fast_timeout < 0.1
+
+    delay['s'] = 0.2  # 10x slowdown
+    results = [(await agent._call_llm_upstream('p', 8, 0.0, None, None))['ok'] for _ in range(20)]
+    assert not results[0]
+    assert all(results[-5:])  # timed-out calls pushed p99 up until the timeout covered 0.2s
+    assert agent._adaptive_timeout(agent.llm_url) > 0.2
+    await agent.aclose()
+
+
+@pytest.mark.asyncio
+async def test_hedged_call_takes_the_faster_answer():
+    agent = PolarisAgent(llm_url='http://llm', hedge=True)
+    for _ in range(agent.timeout_min_samples):
+        agent._record_latency(agent.llm_url, 0.01)
+    assert agent._adaptive_timeout(agent.llm_url) == agent.timeout_min
+
+    delays = [0.5, 0.0]
+
+    async def upstream(prompt, max_tokens, temperature, timeout, model, route=None):
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return {'ok': True, 'text': 'slow' if delay else 'fast'}
+
+    agent._call_llm_upstream = upstream
+    res = await agent.call_llm('extract', temperature=0.0)
+    assert res['text'] == 'fast'
+    assert agent.hedge_budget.stats()['sent'] == 1
+    assert agent.hedge_budget.stats()['won'] == 1
+
+
+@pytest.mark.asyncio
+async def test_extraction_streams_use_the_first_token_timeout_and_are_hedged():
+    agent = PolarisAgent(llm_url='http://llm', hedge=True, extract_batch_size=1)
+    route = agent.router.profile('extract')
+    for _ in range(agent.timeout_min_samples):
+        route.first_token.record(0.01)
+
+    delays = [0.5, 0.0]
+    started, closed, timeouts = [], [], []
+
+    async def upstream(prompt, max_tokens, temperature, timeout, model=None, route=None):
+        delay = delays.pop(0)
+        started.append(delay)
+        timeouts.append(timeout)
+        try:
+            await asyncio.sleep(delay)
+            yield {'type': 'token', 'text': '{"pain": "slow"}' if delay else '{"pain": "fast"}'}
+            yield {'type': 'done'}
+        finally:
+            closed.append(delay)
+
+    agent._call_llm_stream_upstream = upstream
+    session = {'slots': {}}
+    await agent._extract_slots_from_message(session, 'mensagem sem slots locais')
+    assert session['slots']['pain'] == 'fast'
+    assert started == [0.5, 0.0] and sorted(closed) == [0.0, 0.5]  # the slow attempt was cancelled
+    assert timeouts == [agent.timeout_min] * 2  # 1.5 x p99 of 10 ms, clamped
+    assert agent.hedge_budget.stats()['sent'] == 1
+    assert agent.hedge_budget.stats()['won'] == 1
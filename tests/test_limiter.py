@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from polaris.agent_core import PolarisAgent
+from polaris.limiter import AdaptiveLimiter, LLMOverloaded
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_then_sheds():
+    limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=1, queue_timeout=1.0)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.stats()['queue_depth'] == 1
+
+    with pytest.raises(LLMOverloaded):
+        await limiter.acquire()
+    assert limiter.stats()['shed'] == 1
+
+    limiter.release(0.05)
+    await waiter
+    assert limiter.stats()['inflight'] == 1
+
+
+def test_limiter_aimd_adjusts_on_latency():
+    limiter = AdaptiveLimiter(initial_limit=10)
+    limiter.inflight = 2
+    limiter.release(0.1)
+    assert limiter.limit == pytest.approx(10.1)
+    limiter.release(1.0)  # 10x slower than the average: back off
+    assert limiter.limit == pytest.approx(10.1 * 0.9)
+
+
+@pytest.mark.asyncio
+async def test_long_healthy_streams_do_not_shrink_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=20)
+    agent = PolarisAgent(llm_url='http://llm', limiter=limiter)
+    body = b''.join(b'data: {"text": "t"}\n\n' for _ in range(5)) + b'data: [DONE]\n\n'
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={'content-type': 'text/event-stream'})
+    ))
+    limiter.inflight += 1
+    limiter.release(0.001)  # short calls set a 1 ms latency average
+    for _ in range(10):
+        async for ev in agent.call_llm_stream('oi'):
+            await asyncio.sleep(0.005)  # generation takes far longer than a short call
+    assert limiter.limit >= 20
+    assert limiter.stats()['latency_ewma_ms'] == pytest.approx(1.0)
+    assert limiter.stats()['inflight'] == 0
+    await agent.aclose()
+
+
+@pytest.mark.asyncio
+async def test_chat_returns_503_with_retry_after_when_shed(monkeypatch):
+    import importlib
+    pol_app = importlib.import_module('polaris.app')
+
+    async def overloaded(*args, **kwargs):
+        raise LLMOverloaded(retry_after=3)
+
+    monkeypatch.setattr(pol_app.agent, 'call_llm', overloaded)
+    transport = ASGITransport(app=pol_app.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        r = await ac.post('/api/v1/chat', json={"message": "oi"})
+    assert r.status_code == 503
+    assert r.headers['retry-after'] == '3'
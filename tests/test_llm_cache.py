@@ -0,0 +1,118 @@
+import json
+
+import httpx
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.llm_cache import ResponseCache, cache_key
+
+
+def test_memory_tier_lru_and_ttl(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl=10)
+    cache.set('a', {'text': 'A'})
+    cache.set('b', {'text': 'B'})
+    assert cache.get('a') == {'text': 'A'}
+    cache.set('c', {'text': 'C'})  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == {'text': 'C'}
+
+    import polaris.llm_cache as mod
+    now = mod.time.time()
+    monkeypatch.setattr(mod.time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 2
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    key = cache_key('p', 256, 0.0, None)
+    first = ResponseCache(path=path)
+    first.set(key, {'text': 'persisted'})
+    first.close()
+
+    second = ResponseCache(path=path)
+    assert second.get(key) == {'text': 'persisted'}
+    assert second.stats()['disk_hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_call_llm_caches_only_deterministic_calls():
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json={'text': 'hello'})
+
+    agent = PolarisAgent(llm_url='http://llm', cache=ResponseCache())
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    r1 = await agent.call_llm('same', temperature=0.0)
+    r2 = await agent.call_llm('same', temperature=0.0)
+    assert r1['text'] == r2['text'] == 'hello'
+    assert r2.get('cached') is True
+    assert len(calls) == 1
+
+    await agent.call_llm('same', temperature=0.7)
+    await agent.call_llm('same', temperature=0.7)
+    assert len(calls) == 3
+    await agent.aclose()
+
+
+@pytest.mark.asyncio
+async def test_failed_or_empty_streams_are_not_cached():
+    bodies = [
+        b'data: {"text": "x"}\n\nevent: error\ndata: overloaded\n\n',
+        b'data: [DONE]\n\n',
+        b'data: {"text": "ok"}\n\ndata: [DONE]\n\n',
+    ]
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, content=bodies[len(calls) - 1], headers={'content-type': 'text/event-stream'})
+
+    agent = PolarisAgent(llm_url='http://llm', cache=ResponseCache())
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        return [ev async for ev in agent.call_llm_stream('same', temperature=0.0)]
+
+    assert (await run())[-1]['type'] == 'error'
+    assert await run() == [{'type': 'done'}]
+    assert await run() == [{'type': 'token', 'text': 'ok'}, {'type': 'done'}]
+    assert (await run())[0] == {'type': 'token', 'text': 'ok', 'cached': True}
+    assert len(calls) == 3
+    await agent.aclose()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_written_behind_and_capped(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(max_entries=2, path=path, max_disk_entries=5, flush_interval=60, purge_every=4)
+    await cache.start()
+    for i in range(3):
+        cache.set(f'k{i}', {'text': str(i)})
+    assert cache.stats()['pending'] == 3 and cache.stats()['disk_writes'] == 0
+    assert cache.get('k0') == {'text': '0'}  # evicted from memory, served from the buffer
+
+    for i in range(3, 8):
+        cache.set(f'k{i}', {'text': str(i)})
+    await cache.aclose()  # drains the buffer; 8 writes trigger a purge down to the cap
+    assert cache.stats()['disk_writes'] == 8 and cache.stats()['purged'] == 3
+    cache.close()
+
+    reopened = ResponseCache(path=path)
+    assert reopened.get('k2') is None
+    assert reopened.get('k7') == {'text': '7'}
+    reopened.close()
+
+
+def test_purge_expired_clears_the_disk_tier(tmp_path, monkeypatch):
+    import polaris.llm_cache as mod
+    cache = ResponseCache(ttl=10, path=str(tmp_path / 'cache.db'))
+    cache.set('a', {'text': 'A'})
+    now = mod.time.time()
+    monkeypatch.setattr(mod.time, 'time', lambda: now + 11)
+    assert cache.purge_expired() == 1
+    assert cache.stats()['size'] == 0
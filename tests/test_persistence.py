@@ -0,0 +1,79 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.persistence import ConversationPersister
+from polaris.sessions import MemorySessionStore
+
+
+def transcript(path, session_id):
+    conn = sqlite3.connect(path)
+    row = conn.execute('SELECT transcript, client_id FROM conversations WHERE session_id = ?', (session_id,)).fetchone()
+    conn.close()
+    return json.loads(row[0]), row[1]
+
+
+@pytest.mark.asyncio
+async def test_turns_are_batched_and_appended_in_order(tmp_path):
+    path = str(tmp_path / 'conv.db')
+    p = ConversationPersister.sqlite(path, max_batch=1000, flush_interval=60)
+    for i in range(6):
+        p.record_turn('s1', {'from': 'client', 'text': f't{i}', 'ts': float(i)}, client_id='c1')
+        p.record_turn('s2', {'from': 'client', 'text': f'u{i}', 'ts': float(i)})
+        if i == 2:
+            assert await p.flush() == 2  # one upsert row per session, not per turn
+    p.record_summary('s1', 'resumo')
+    assert await p.flush() == 2
+    turns, client_id = transcript(path, 's1')
+    assert [t['text'] for t in turns] == [f't{i}' for i in range(6)] and client_id == 'c1'
+    assert p.stats()['turns_written'] == 12 and p.stats()['flushes'] == 2
+    await p.aclose()
+
+
+@pytest.mark.asyncio
+async def test_size_trigger_failure_requeue_and_drain_on_shutdown(tmp_path):
+    path = str(tmp_path / 'conv.db')
+    p = ConversationPersister.sqlite(path, max_batch=3, flush_interval=60)
+    await p.start()
+    for i in range(3):
+        p.record_turn('s1', {'from': 'client', 'text': f't{i}', 'ts': float(i)})
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if p.stats()['flushes']:
+            break
+    assert p.stats()['flushes'] == 1 and p.stats()['pending_turns'] == 0
+
+    connect = p.connect
+    p._conn, p.connect = None, lambda: (_ for _ in ()).throw(sqlite3.OperationalError('db down'))
+    p.record_turn('s1', {'from': 'assistant', 'text': 'r1', 'ts': 3.0})
+    with pytest.raises(sqlite3.OperationalError):
+        await p.flush()
+    p.record_turn('s1', {'from': 'client', 'text': 't3', 'ts': 4.0})
+    assert p.stats()['pending_turns'] == 2 and p.stats()['failures'] == 1
+
+    p.connect = connect
+    await p.aclose()  # drains what is still buffered
+    turns, _ = transcript(path, 's1')
+    assert [t['text'] for t in turns] == ['t0', 't1', 't2', 'r1', 't3']
+
+
+@pytest.mark.asyncio
+async def test_agent_turns_reach_the_conversations_table(tmp_path):
+    path = str(tmp_path / 'conv.db')
+    agent = PolarisAgent(
+        llm_url='http://llm',
+        sessions=MemorySessionStore(),
+        persister=ConversationPersister.sqlite(path, flush_interval=60),
+    )
+    await agent.start()
+    sid = agent.create_session(client_id='c9')
+    async with agent.sessions.edit(sid) as s:
+        agent.append_turn(s, 'client', 'Olá')
+        agent.append_turn(s, 'assistant', 'Oi!')
+    await agent.aclose()
+    turns, client_id = transcript(path, sid)
+    assert [(t['from'], t['text']) for t in turns] == [('client', 'Olá'), ('assistant', 'Oi!')]
+    assert client_id == 'c9'
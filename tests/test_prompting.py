@@ -0,0 +1,23 @@
+from polaris.prompting import PromptBuilder, estimate_tokens, truncate_to_tokens
+
+
+def test_truncate_keeps_head_and_tail_within_budget():
+    text = 'inicio ' + 'palavra ' * 2000 + 'fim'
+    out = truncate_to_tokens(text, 100)
+    assert estimate_tokens(out) <= 100
+    assert out.startswith('inicio') and out.endswith('fim')
+    assert truncate_to_tokens('curto', 100) == 'curto'
+
+
+def test_builder_prefers_recent_history_and_respects_budget():
+    history = [{'from': 'client' if i % 2 == 0 else 'assistant', 'text': f'turno {i} ' + 'x' * 200} for i in range(50)]
+    builder = PromptBuilder(budget=400)
+    prompt = builder.build('Instrução.', 'pergunta atual', history, summary='resumo anterior')
+    assert estimate_tokens(prompt) <= 400
+    assert 'turno 49' in prompt and 'turno 0 ' not in prompt
+    assert 'resumo anterior' in prompt
+    assert prompt.endswith('Message: "pergunta atual"')
+
+
+def test_builder_without_history_keeps_single_line_prompt():
+    assert PromptBuilder(budget=100).build('Say hi.', 'oi') == 'Say hi. Message: "oi"'
@@ -0,0 +1,33 @@
+import json
+
+import httpx
+import pytest
+
+from polaris.agent_core import PolarisAgent
+
+
+@pytest.mark.asyncio
+async def test_extraction_is_routed_to_the_small_model(monkeypatch):
+    monkeypatch.setenv('LLM_ROUTES', json.dumps({
+        'extract': {'model': 'flash', 'url': 'http://small:8100', 'max_tokens': 128},
+    }))
+    monkeypatch.setenv('LLM_MODEL_CHAT', 'pro')
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, json.loads(request.content)))
+        return httpx.Response(200, json={'text': '{}'})
+
+    agent = PolarisAgent(llm_url='http://big:8100')
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    await agent.call_llm('extrair', temperature=0.0, task='extract')
+    await agent.call_llm('conversar', temperature=0.7, task='chat')
+
+    assert seen[0][0] == 'small'
+    assert seen[0][1]['model'] == 'flash' and seen[0][1]['max_tokens'] == 128
+    assert seen[1][0] == 'big'
+    assert seen[1][1]['model'] == 'pro' and seen[1][1]['max_tokens'] == 512
+    routes = agent.metrics()['llm_routes']
+    assert routes['extract']['calls'] == 1 and routes['chat']['calls'] == 1
+    await agent.aclose()
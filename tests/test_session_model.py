@@ -0,0 +1,32 @@
+import json
+
+from polaris.prompting import build_chat_prompt
+from polaris.session_model import Session, Turn, TurnLog
+
+
+def test_turn_log_is_bounded_and_reads_like_dicts():
+    log = TurnLog(max_turns=3)
+    for i in range(5):
+        log.append({'from': 'client' if i % 2 == 0 else 'assistant', 'text': f'msg {i}', 'ts': float(i)})
+    assert len(log) == 3
+    assert [t['text'] for t in log] == ['msg 2', 'msg 3', 'msg 4']
+    assert log[-1] == {'from': 'client', 'text': 'msg 4', 'ts': 4.0}
+    assert log[0].get('from') == 'client' and log[0].get('missing', 'x') == 'x'
+    log.append(Turn('reviewer', 'novo papel', 5.0))
+    assert log[-1].role == 'reviewer'
+
+
+def test_session_dict_view_and_round_trip():
+    s = Session('s1', client_id='c1', created_at=1.0)
+    assert s.get('slots', {}) == {} and 'summary' not in s
+    s.setdefault('turns', []).append({'from': 'client', 'text': 'Olá', 'ts': 2.0})
+    s['slots'] = {'kpi': 'NPS'}
+    s['channel'] = 'ws'
+    data = json.loads(json.dumps(s.to_dict()))
+    assert data == {
+        'session_id': 's1', 'client_id': 'c1', 'metadata': {}, 'created_at': 1.0,
+        'turns': [{'from': 'client', 'text': 'Olá', 'ts': 2.0}], 'slots': {'kpi': 'NPS'}, 'channel': 'ws',
+    }
+    restored = Session.from_dict(data)
+    assert restored.to_dict() == data
+    assert build_chat_prompt('E agora?', list(restored.get('turns') or [])).count('User: Olá') == 1
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.session_model import Session
+from polaris.sessions import MemorySessionStore, SharedSessionStore, SQLiteSessionStore
+
+
+def test_memory_store_stays_bounded_under_churn():
+    store = MemorySessionStore(max_entries=100, ttl=3600, stripes=8)
+    for i in range(10000):
+        store.put(f's{i}', {'turns': [], 'n': i})
+    assert len(store) <= 100
+    assert store.get('s9999') == {'turns': [], 'n': 9999}
+    assert store.get('s0') is None
+    assert store.stats()['evictions'] >= 9900
+
+
+def test_memory_store_lru_and_idle_ttl():
+    store = MemorySessionStore(max_entries=2, ttl=3600, stripes=1)
+    store.put('a', {'n': 1})
+    store.put('b', {'n': 2})
+    store.get('a')  # 'b' is now least recently used
+    store.put('c', {'n': 3})
+    assert 'a' in store and 'b' not in store and 'c' in store
+
+    store.ttl = 0.0
+    assert store.get('a') is None
+    assert store.purge_expired() == 1
+    assert len(store) == 0
+
+
+def test_sqlite_store_persists_in_wal_mode(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SQLiteSessionStore(path)
+    store.put('s1', {'turns': [{'from': 'client', 'text': 'olá', 'ts': 1.0}], 'slots': {'kpi': 'NPS'}})
+    store.close()
+
+    store = SQLiteSessionStore(path)
+    assert store._db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert store.get('s1')['turns'][0]['text'] == 'olá'
+    assert store.delete('s1') and store.get('s1') is None
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_edit_serialises_one_session_and_writes_back(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), stripes=4)
+    store.put('s1', {'turns': []})
+
+    async def append(i):
+        async with store.edit('s1') as s:
+            turns = s['turns']
+            await asyncio.sleep(0)  # without the lock, concurrent edits would lose turns
+            turns.append({'from': 'client', 'text': str(i), 'ts': float(i)})
+
+    await asyncio.gather(*[append(i) for i in range(20)])
+    assert sorted(t['ts'] for t in store.get('s1')['turns']) == list(range(20))
+    with pytest.raises(KeyError):
+        async with store.edit('missing'):
+            pass
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_discovery_with_sqlite_sessions(tmp_path):
+    agent = PolarisAgent(llm_url='http://llm', sessions=SQLiteSessionStore(str(tmp_path / 's.db')))
+
+    async def no_llm(*args, **kwargs):
+        raise AssertionError('all slots are known locally')
+        yield
+
+    agent.call_llm_stream = no_llm
+    sid = agent.create_session(client_id='c1')
+    async with agent.sessions.edit(sid) as s:
+        s['slots'] = {'pain': 'atrasos', 'users': 'lojistas'}
+    out = await agent.ask_discovery_questions(sid, 'Orçamento de R$ 20 mil, KPI: conversão')
+    stored = agent.sessions.get(sid)
+    assert stored['turns'][0]['text'] == 'Orçamento de R$ 20 mil, KPI: conversão'
+    assert stored['slots']['budget'] == out['slots']['budget']
+    assert agent.metrics()['sessions']['backend'] == 'sqlite'
+
+
+def test_shared_store_sees_other_workers_writes(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    a, b = SharedSessionStore(path), SharedSessionStore(path)
+    sid = 's1'
+    a.put(sid, Session(sid, created_at=1.0))
+    assert b.get(sid) is not None
+    assert b.get(sid) is b.get(sid)  # served from b's local cache
+    hits = b.stats()['cache_hits']
+
+    s = a.get(sid)
+    s['slots'] = {'kpi': 'NPS'}
+    a.put(sid, s)
+    assert b.get(sid)['slots'] == {'kpi': 'NPS'}  # a's commit invalidated b's copy
+    assert b.stats()['cache_hits'] == hits
+    a.close()
+    b.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_store_revalidates_each_cached_session(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    w1, w2 = SharedSessionStore(path), SharedSessionStore(path)
+    for sid in ('A', 'B'):
+        w1.put(sid, Session(sid))
+        assert w2.get(sid) is not None  # both cached in w2
+    async with w1.edit('B') as s:
+        s['slots'] = {'budget': 'b'}
+    # w2 notices the foreign commit while reading A; B must not be trusted because of it
+    async with w2.edit('A') as s:
+        s['slots'] = {'kpi': 'a'}
+    assert w2.get('B')['slots'] == {'budget': 'b'}
+    async with w1.edit('A') as s:
+        s['slots']['users'] = 'x'
+    async with w2.edit('B') as s:
+        s['slots']['pain'] = 'p'
+    assert w1.get('B')['slots'] == {'budget': 'b', 'pain': 'p'}
+    assert w2.get('A')['slots'] == {'kpi': 'a', 'users': 'x'}
+    w1.close()
+    w2.close()
+
+
+_WORKER = '''
+import asyncio, sys
+from polaris.sessions import SharedSessionStore
+
+async def main(path, name):
+    store = SharedSessionStore(path)
+    for i in range(25):
+        async with store.edit('s1') as s:
+            s['turns'].append({'from': 'client', 'text': name, 'ts': float(i)})
+            await asyncio.sleep(0.001)
+    store.close()
+
+asyncio.run(main(sys.argv[1], sys.argv[2]))
+'''
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='cross-process session locks need fcntl')
+def test_shared_store_edits_are_atomic_across_processes(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    store = SharedSessionStore(path)
+    store.put('s1', Session('s1'))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    workers = [subprocess.Popen([sys.executable, '-c', _WORKER, path, f'w{i}'], env=env) for i in range(2)]
+    assert [w.wait(timeout=60) for w in workers] == [0, 0]
+    texts = [t['text'] for t in store.get('s1')['turns']]
+    assert sorted(texts) == ['w0'] * 25 + ['w1'] * 25
+    store.close()
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from polaris.agent_core import PolarisAgent, SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_upstream_request():
+    agent = PolarisAgent(llm_url='http://llm')
+    calls = []
+
+    async def fake_upstream(prompt, max_tokens, temperature, timeout, model, route=None):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return {'ok': True, 'text': 'shared'}
+
+    agent._call_llm_upstream = fake_upstream
+    results = await asyncio.gather(*[agent.call_llm('dup', temperature=0.0) for _ in range(5)])
+    assert [r['text'] for r in results] == ['shared'] * 5
+    assert calls == ['dup']
+    assert agent.flight.stats() == {'leaders': 1, 'shared': 4, 'inflight': 0}
+
+    results[0]['text'] = 'mutated'
+    assert results[1]['text'] == 'shared'
+
+
+@pytest.mark.asyncio
+async def test_stream_fanout_replays_to_late_subscribers():
+    flight = SingleFlight()
+    started = []
+
+    async def upstream():
+        started.append(1)
+        for t in ('a', 'b', 'c'):
+            yield t
+            await asyncio.sleep(0.005)
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [t async for t in flight.stream('k', upstream)]
+
+    first, second = await asyncio.gather(consume(0), consume(0.007))
+    assert first == second == ['a', 'b', 'c']
+    assert started == [1]
@@ -32,22 +32,22 @@ async def test_discovery_flow_with_extractor(monkeypatch):
     pol_app = importlib.import_module('polaris.app')
     app = pol_app.app
 
-    # fake call_llm to return an extraction JSON
-    async def fake_call_llm(prompt, max_tokens=256, temperature=0.0, timeout=10):
-        return {
-            'ok': True,
-            'text': json.dumps({
-                'pain': 'Preciso reduzir churn',
-                'users': 'Clientes B2C mobile',
-                'kpi': 'retenção',
-                'budget': '20000',
-                'confidence': {'pain': 0.9, 'users': 0.8, 'kpi': 0.85, 'budget': 0.7}
-            })
-        }
+    # fake call_llm_stream to stream an extraction JSON, token by token
+    async def fake_call_llm_stream(prompt, max_tokens=256, temperature=0.0, timeout=10, **kwargs):
+        text = json.dumps({
+            'pain': 'Preciso reduzir churn',
+            'users': 'Clientes B2C mobile',
+            'kpi': 'retenção',
+            'budget': '20000',
+            'confidence': {'pain': 0.9, 'users': 0.8, 'kpi': 0.85, 'budget': 0.7}
+        })
+        for i in range(0, len(text), 7):
+            yield {'type': 'token', 'text': text[i:i + 7]}
+        yield {'type': 'done'}
 
     # patch the agent instance in the app
     monkeypatch.setattr(pol_app, 'agent', pol_app.agent)
-    monkeypatch.setattr(pol_app.agent, 'call_llm', fake_call_llm)
+    monkeypatch.setattr(pol_app.agent, 'call_llm_stream', fake_call_llm_stream)
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.session_model import Session
+from polaris.sessions import MemorySessionStore
+from polaris.snapshot import iter_snapshot, restore_snapshot, write_snapshot
+
+
+def test_snapshot_round_trip_keeps_sessions_turns_and_lru_order(tmp_path):
+    path = str(tmp_path / 'sessions.snap')
+    store = MemorySessionStore(max_entries=100, stripes=1)
+    for i in range(5):
+        s = Session(f's{i}', client_id=f'c{i}', created_at=float(i), slots={'kpi': 'NPS'})
+        s['turns'].append({'from': 'client', 'text': f'olá 🚀 {i}', 'ts': 10.0 + i})
+        s['turns'].append({'from': 'reviewer', 'text': 'x' * 100, 'ts': 20.0 + i})
+        store.put(f's{i}', s)
+    store.get('s0')  # most recently used now
+    assert write_snapshot(store, path) == 5
+
+    restored = MemorySessionStore(max_entries=100, stripes=1)
+    assert restore_snapshot(restored, path) == 5
+    assert [sid for sid, _, _ in restored.entries()] == ['s1', 's2', 's3', 's4', 's0']
+    for sid, _, s in restored.entries():
+        assert s.to_dict() == store.get(sid).to_dict()
+
+
+def test_truncated_snapshot_restores_complete_records(tmp_path):
+    path = str(tmp_path / 'sessions.snap')
+    store = MemorySessionStore()
+    for i in range(3):
+        store.put(f's{i}', Session(f's{i}'))
+    write_snapshot(store, path)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    assert len(list(iter_snapshot(path))) == 2
+
+
+@pytest.mark.asyncio
+async def test_agent_snapshots_on_shutdown_and_restores_on_start(tmp_path, monkeypatch):
+    monkeypatch.setenv('SESSION_SNAPSHOT_PATH', str(tmp_path / 'sessions.snap'))
+    agent = PolarisAgent(llm_url='http://llm', sessions=MemorySessionStore())
+    await agent.start()
+    sid = agent.create_session(client_id='c1')
+    async with agent.sessions.edit(sid) as s:
+        agent.append_turn(s, 'client', 'Preciso de um app')
+    await agent.aclose()
+
+    agent = PolarisAgent(llm_url='http://llm', sessions=MemorySessionStore())
+    await agent.start()
+    s = agent.sessions.get(sid)
+    assert s['client_id'] == 'c1' and s['turns'][0]['text'] == 'Preciso de um app'
+    assert agent.metrics()['session_snapshots']['last_restore']['sessions'] == 1
+    await agent.aclose()
@@ -0,0 +1,57 @@
+import httpx
+import pytest
+
+from polaris.agent_core import PolarisAgent
+from polaris.sse import SSEDecoder
+
+
+def test_decoder_handles_split_chunks_and_multiline_events():
+    body = ': keep-alive\r\nevent: delta\r\nid: 7\r\ndata: first\r\ndata: sec\xc3\xa7ond\r\n\r\ndata: {"text": "x"}\n\n'.encode('latin-1')
+    decoder = SSEDecoder()
+    events = []
+    for i in range(len(body)):  # worst case: one byte per network chunk
+        events.extend(decoder.feed(body[i:i + 1]))
+    assert [(e.event, e.data, e.id) for e in events] == [
+        ('delta', 'first\nsecçond', '7'),
+        ('message', '{"text": "x"}', '7'),
+    ]
+
+
+def test_decoder_flushes_event_without_trailing_blank_line():
+    decoder = SSEDecoder()
+    assert decoder.feed(b'data: tail') == []
+    assert [e.data for e in decoder.flush()] == ['tail']
+
+
+@pytest.mark.asyncio
+async def test_call_llm_stream_yields_tokens_from_sse_bytes():
+    body = b'data: {"text": "Ol"}\n\ndata: {"text": "\xc3\xa1"}\n\ndata: [DONE]\n\n'
+
+    def handler(request):
+        return httpx.Response(200, content=body, headers={'content-type': 'text/event-stream'})
+
+    agent = PolarisAgent(llm_url='http://llm')
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    events = [ev async for ev in agent.call_llm_stream('oi')]
+    assert events == [
+        {'type': 'token', 'text': 'Ol'},
+        {'type': 'token', 'text': 'á'},
+        {'type': 'done'},
+    ]
+    await agent.aclose()
+
+
+@pytest.mark.asyncio
+async def test_error_event_fails_the_stream():
+    body = b'data: {"text": "Ol"}\n\nevent: error\ndata: model crashed\n\ndata: {"text": "x"}\n\n'
+
+    def handler(request):
+        return httpx.Response(200, content=body, headers={'content-type': 'text/event-stream'})
+
+    agent = PolarisAgent(llm_url='http://llm')
+    agent._build_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    events = [ev async for ev in agent.call_llm_stream('oi', temperature=0.7)]
+    assert events == [{'type': 'token', 'text': 'Ol'}, {'type': 'error', 'error': 'model crashed'}]
+    assert agent.breaker.failures == 1
+    assert agent.balancer.stats()['http://llm']['failures'] == 1
+    await agent.aclose()
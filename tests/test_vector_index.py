@@ -0,0 +1,98 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from polaris.adapters import embeddings, vector_index
+from polaris.adapters.vector_index import FlatIndex, IVFIndex
+from polaris.agent_core import PolarisAgent
+
+
+def corpus(n=6000, dim=32, clusters=40, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim)), rng
+
+
+def test_flat_search_is_exact_and_upsert_replaces_by_id():
+    vectors, rng = corpus(n=500)
+    index = FlatIndex()
+    assert index.upsert(list(range(500)), vectors, [{'i': i} for i in range(500)]) == 500
+    queries = rng.normal(size=(3, 32))
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for q, got in zip(queries, index.search_many(queries, top_k=5)):
+        expected = np.argsort(-(normed @ (q / np.linalg.norm(q))))[:5]
+        assert [m['id'] for m in got] == list(expected)
+    assert index.upsert([7], [queries[0]], [{'i': 'new'}]) == 0
+    top = index.search(queries[0], top_k=1)[0]
+    assert top['id'] == 7 and top['score'] == pytest.approx(1.0) and top['metadata'] == {'i': 'new'}
+    with pytest.raises(ValueError):
+        index.upsert(['x'], [[1.0, 2.0]])
+
+
+def test_ivf_recall_against_flat_and_persistence(tmp_path):
+    vectors, rng = corpus()
+    ids = [f'p{i}' for i in range(len(vectors))]
+    flat, ivf = FlatIndex(), IVFIndex(nprobe=8, min_train=1000)
+    flat.upsert(ids, vectors)
+    ivf.upsert(ids, vectors)
+    queries = vectors[rng.choice(len(vectors), 50)] + 0.1 * rng.normal(size=(50, 32))
+    hits = 0
+    for exact, approx in zip(flat.search_many(queries, 10), ivf.search_many(queries, 10)):
+        hits += len({m['id'] for m in exact} & {m['id'] for m in approx})
+    assert hits / 500 >= 0.9
+    assert ivf.stats()['trainings'] == 1 and ivf.stats()['nlist'] == int(np.sqrt(len(vectors)))
+
+    path = str(tmp_path / 'index.npz')
+    flat.save(path)
+    restored = FlatIndex()
+    assert restored.load(path) == len(vectors)
+    assert [m['id'] for m in restored.search(queries[0], 3)] == [m['id'] for m in flat.search(queries[0], 3)]
+
+
+@pytest.mark.asyncio
+async def test_local_backend_serves_select_portfolio_without_a_network_hop(monkeypatch):
+    monkeypatch.setattr(embeddings, 'VECTOR_BACKEND', 'local')
+    monkeypatch.setattr(vector_index, '_index', FlatIndex())
+
+    async def fake_embed(text, model=None):
+        return [1.0, 0.0] if 'loja' in text else [0.0, 1.0]
+
+    monkeypatch.setattr(embeddings, 'aembed', fake_embed)
+    statuses = await embeddings.aupsert_vectors([
+        ('shop', [0.9, 0.1], {'title': 'Loja virtual', 'description': 'Checkout e catálogo', 'stack': ['react']}),
+        ('crm', [0.1, 0.9], {'title': 'CRM B2B'}),
+    ])
+    assert all(s['ok'] for s in statuses)
+    static = await PolarisAgent(llm_url='http://llm').select_portfolio('quero uma loja online', top_k=1)
+    assert static[0]['id'] == 1  # vector search is opt-in
+
+    monkeypatch.setenv('PORTFOLIO_VECTOR_SEARCH', '1')
+    agent = PolarisAgent(llm_url='http://llm')
+    candidates = await agent.select_portfolio('quero uma loja online', top_k=1)
+    assert candidates == [{
+        'title': 'Loja virtual', 'description': 'Checkout e catálogo', 'stack': ['react'],
+        'id': 'shop', 'score': pytest.approx(0.9 / np.hypot(0.9, 0.1)), 'rationale': 'Checkout e catálogo',
+    }]
+    assert embeddings.index_stats()['vectors'] == 2
+
+
+def test_sync_wrappers_leave_saving_the_local_index_to_save_index(monkeypatch, tmp_path):
+    path = tmp_path / 'index.npz'
+    monkeypatch.setattr(embeddings, 'VECTOR_BACKEND', 'local')
+    monkeypatch.setattr(vector_index, 'VECTOR_INDEX_PATH', str(path))
+    monkeypatch.setattr(vector_index, '_index', FlatIndex())
+    monkeypatch.setattr(vector_index, '_dirty', False)
+
+    for i in range(3):
+        assert embeddings.upsert_vector(f'v{i}', [1.0, float(i)])
+    assert not path.exists()
+    assert embeddings.save_index() is True
+    assert path.exists()
+    assert embeddings.save_index() is False  # nothing changed since
+
+
+def test_local_bulk_upsert_reports_malformed_items(monkeypatch):
+    monkeypatch.setattr(vector_index, '_index', FlatIndex())
+    statuses = vector_index.upsert_vectors([('a', [1.0, 0.0]), {'vector': [0.0, 1.0]}, ('b', [0.0, 1.0])], batch_size=2)
+    assert [(s['id'], s['ok']) for s in statuses] == [('a', True), (None, False), ('b', True)]
+    assert len(vector_index.get_index()) == 2